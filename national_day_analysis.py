@@ -1,10 +1,11 @@
 import os
 import logging
-import litellm
 import requests
 from bs4 import BeautifulSoup
 import codecs
 
+from src.api import chat_completions
+
 def unescape_unicode(s: str) -> str:
     # Chỉ decode khi có pattern \uXXXX để tránh “phá” chuỗi bình thường
     if "\\u" in s:
@@ -38,31 +39,27 @@ logger.addHandler(console_handler)
 # ======================
 # Cấu hình API
 # ======================
-litellm.api_base = "https://api.thucchien.ai"
-API_KEY = "sk-TOcGVBs-iLLtm6mcRiw3fw"  # KHÔNG hardcode trên máy thật
+# src.api đọc THUCCHIEN_API_KEY / THUCCHIEN_API_BASE từ biến môi trường hoặc file .env
 
 def analyze_national_day_activities(query: str) -> str:
     """
     Gọi LLM để phân tích. Trả về CHUỖI kết quả thuần (plain text),
     không kèm thời gian/nguồn tham khảo.
+    Đi qua src.api.chat_completions nên câu hỏi lặp lại được trả từ cache (data/cache/chat).
     """
     try:
-        resp = litellm.completion(
-            custom_llm_provider="openai",   # ép dùng OpenAI-compatible, tránh Vertex
+        result = chat_completions(
             model="gemini-2.5-flash",       # tên model phía thucchien.ai hỗ trợ
-            api_key=API_KEY,
             messages=[
                 {"role": "system", "content": "Bạn là một trợ lý ảo chuyên tổng hợp và phân tích thông tin từ các nguồn tin tức."},
                 {"role": "user", "content": query},
             ],
-            # Tham số mở rộng đặt trong extra_body (nếu cần web search)
-            extra_body={
-                "web_search_options": {"search_context_size": "medium"}
-            },
+            use_web_search=True,            # web_search_options: {"search_context_size": "medium"}
         )
-        return resp.choices[0].message.content
+        logger.debug(f"cache: {result.get('cache')}")
+        return result["content"]
     except Exception as e:
-        return f"Lỗi khi gọi LiteLLM: {e}"
+        return f"Lỗi khi gọi API: {e}"
 
 def extract_images_from_url(url: str):
     """
@@ -127,5 +124,5 @@ if __name__ == "__main__":
 
     # 3) Gợi ý cuối (plain)
     logger.info("Lưu ý: đặt API key qua biến môi trường THUCCHIEN_API_KEY.")
-    logger.info("Cài đặt: pip install litellm requests beautifulsoup4")
+    logger.info("Cài đặt: pip install -r requirements.txt beautifulsoup4")
     logger.info("Chạy: python national_day_analysis.py")
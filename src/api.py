@@ -1,13 +1,26 @@
 # src/api.py
 import os
 import base64
+import hashlib
+import itertools
 import time
-import requests
 import json
 import imghdr
+import queue
+import asyncio
+import tempfile
+import threading
+import weakref
+import unicodedata
+import httpx
+from pathlib import Path
 from dotenv import load_dotenv
-import litellm
-from openai import OpenAI
+
+from . import blobs
+from .cache import ResponseCache, SizedLRU, BlobCache, cache_key, content_hash, file_hash
+from .paths import CACHE_DIR
+from .ratelimit import with_retries, status_of, was_rejected, RETRY_STATUSES
+from .logger import log_json
 
 load_dotenv()
 
@@ -17,18 +30,237 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")  # Google Gemini key
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gemini-2.5-flash")
 DEFAULT_TEMP = float(os.getenv("TEMPERATURE", "1.0"))
 
-# Configure LiteLLM client base
-litellm.api_base = API_BASE
+# ---- Shared HTTP connection pool ----
+# One keep-alive pool per event loop for every call to the gateway: raw requests (video,
+# download, TTS), the OpenAI client and LiteLLM all reuse the same TCP+TLS connections.
+HTTP_POOL_SIZE = int(os.getenv("THUCCHIEN_HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE_S = float(os.getenv("THUCCHIEN_HTTP_KEEPALIVE", "60"))
+HTTP_TIMEOUT_S = float(os.getenv("THUCCHIEN_HTTP_TIMEOUT", "120"))
+HTTP_PREWARM = os.getenv("THUCCHIEN_HTTP_PREWARM", "1") == "1"
+STARTUP_PRELOAD = os.getenv("THUCCHIEN_PRELOAD_SDKS", "1") == "1"
+
+# LiteLLM and the OpenAI SDK take seconds to import, so they are loaded on first use
+# (or ahead of time in the background with preload_sdks) instead of at import.
+_litellm_module = None
+
+
+def _litellm():
+    """Import and configure LiteLLM on first use."""
+    global _litellm_module
+    if _litellm_module is None:
+        import litellm
+
+        litellm.api_base = API_BASE
+        _litellm_module = litellm
+    return _litellm_module
+
+
+def preload_sdks(background=True):
+    """
+    Import LiteLLM and the OpenAI SDK ahead of the first request, so startup does not pay
+    for them but the first chat does not either.
+    """
+    def _load():
+        import openai  # noqa: F401
+
+        _litellm()
+
+    if background:
+        threading.Thread(target=_load, name="api-preload", daemon=True).start()
+    else:
+        _load()
+
+
+def _build_http_client():
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_S,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT_S, connect=10.0),
+        headers={"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"},
+        follow_redirects=True,
+    )
+
+
+# Async connections are bound to the loop that opened them, so clients are kept per loop.
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def _clients():
+    """
+    Return (http_client, openai_client) for the running event loop, creating them on first use.
+    The OpenAI client (also handed to LiteLLM) is built on top of the same httpx pool.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.get(loop)
+    if clients is None:
+        from openai import AsyncOpenAI
+
+        http_client = _build_http_client()
+        # SDK retries are off: with_retries (src/ratelimit.py) handles 429/5xx for every endpoint
+        openai_client = AsyncOpenAI(api_key=API_KEY, base_url=API_BASE, http_client=http_client, max_retries=0)
+        clients = (http_client, openai_client)
+        _loop_clients[loop] = clients
+    return clients
+
+
+# ---- Chat response cache ----
+# Keyed by (API base, model, messages, temperature, web_search_options); disable with CHAT_CACHE=0
+# or per call with bypass_cache=True.
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE", "1") == "1"
+chat_cache = ResponseCache(
+    CACHE_DIR / "chat",
+    memory_items=int(os.getenv("CHAT_CACHE_MEMORY_ITEMS", "256")),
+    disk_max_bytes=int(float(os.getenv("CHAT_CACHE_DISK_MB", "200")) * 1024 * 1024),
+    ttl_s=float(os.getenv("CHAT_CACHE_TTL_S", str(7 * 24 * 3600))),
+)
+
+
+def _chat_cache_key(model, messages, temperature, web_search_options):
+    # API_BASE is part of the key: replies from the fake gateway must never be served by the real one
+    return cache_key("chat", API_BASE, model, messages, temperature, web_search_options)
+
+
+# ---- Background event loop used by the sync wrappers ----
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="api-event-loop", daemon=True).start()
+    return _loop
+
+
+def _run_sync(coro):
+    """
+    Run a coroutine on the shared background loop and block until it finishes.
+    This is what lets every sync endpoint be a thin wrapper over its async version.
+    """
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("Sync API called from the API event loop; await the async variant instead.")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def _iter_sync(agen):
+    """
+    Drive an async generator on the shared background loop and yield its items here.
+    """
+    done = object()
+    items = queue.Queue()
+
+    async def _pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((done, e))
+        else:
+            items.put((done, None))
+
+    future = asyncio.run_coroutine_threadsafe(_pump(), _get_loop())
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        future.cancel()
+
+
+async def awarm_up_gateway():
+    try:
+        http_client, _ = _clients()
+        await http_client.head(API_BASE, timeout=10.0)
+    except httpx.HTTPError:
+        pass
+
+
+def warm_up_gateway(background=True):
+    """
+    Open a pooled connection to API_BASE ahead of the first real call, so the
+    TCP+TLS handshake is not paid by the user's first request.
+    Errors are ignored: this is only an optimization.
+    """
+    future = asyncio.run_coroutine_threadsafe(awarm_up_gateway(), _get_loop())
+    if not background:
+        future.result()
+
+
+# ---- Single-flight ----
+# Concurrent calls with identical parameters share one upstream request. Flights are per
+# event loop; every sync wrapper runs on the shared API loop, so they all coalesce.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT", "1") == "1"
+_loop_flights = weakref.WeakKeyDictionary()
+
+
+async def _single_flight(endpoint: str, model, key: str, call):
+    """
+    Run `await call()` once for all concurrent callers with the same key. Followers get a
+    copy of the leader's result marked "coalesced": True; the number of coalesced calls
+    is logged as an "api.coalesced" event when the flight lands.
+    """
+    if not SINGLE_FLIGHT_ENABLED:
+        return await call()
+    loop = asyncio.get_running_loop()
+    flights = _loop_flights.get(loop)
+    if flights is None:
+        flights = _loop_flights[loop] = {}
 
-# OpenAI-compatible client for image generation via /chat/completions
-openai_client = OpenAI(api_key=API_KEY, base_url=API_BASE)
+    flight = flights.get(key)
+    if flight is not None:
+        flight["followers"] += 1
+        result = await asyncio.shield(flight["task"])
+        return {**result, "coalesced": True} if isinstance(result, dict) else result
 
+    # The upstream call runs as its own task, so a caller that gives up does not cancel
+    # it for everyone else
+    flight = {"task": loop.create_task(call()), "followers": 0, "started": time.time()}
+    flights[key] = flight
 
-def chat_completions(messages, model=None, temperature=None, use_web_search=False):
+    def _landed(task):
+        flights.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+        if flight["followers"]:
+            log_json(
+                {
+                    "type": "api.coalesced",
+                    "endpoint": endpoint,
+                    "model": model,
+                    "key": key[:16],
+                    "coalesced": flight["followers"],
+                    "elapsed_ms": int((time.time() - flight["started"]) * 1000),
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                }
+            )
+
+    flight["task"].add_done_callback(_landed)
+    return await asyncio.shield(flight["task"])
+
+
+async def achat_completions(messages, model=None, temperature=None, use_web_search=False, bypass_cache=False):
     """
     Call /chat/completions with optional web_search_options.
     If use_web_search=True, adds {"search_context_size": "medium"}.
+    Identical requests are answered from chat_cache; result["cache"] is
+    "hit", "miss" or "bypass" (bypass skips the lookup but refreshes the entry).
     """
+    _, openai_client = _clients()
     kwargs = {
         "model": model or DEFAULT_MODEL,
         "messages": messages,
@@ -36,16 +268,137 @@ def chat_completions(messages, model=None, temperature=None, use_web_search=Fals
         "api_key": API_KEY,
         "api_base": API_BASE,
         "custom_llm_provider": "openai",
+        "client": openai_client,
+        "max_retries": 0,  # retries are handled by with_retries
     }
     if use_web_search:
         kwargs["web_search_options"] = {"search_context_size": "medium"}
 
-    resp = litellm.completion(**kwargs)
-    content = getattr(resp.choices[0].message, "content", str(resp))
-    return {"raw": resp, "content": content}
+    key = _chat_cache_key(kwargs["model"], messages, kwargs["temperature"], kwargs.get("web_search_options"))
+    cache_status = "disabled"
+    if CHAT_CACHE_ENABLED:
+        cache_status = "bypass" if bypass_cache else "miss"
+        if not bypass_cache:
+            cached = chat_cache.get(key)
+            if cached is not None:
+                return {"raw": cached["raw"], "content": cached["content"], "cache": "hit"}
 
+    async def _fetch():
+        resp = await with_retries("chat", kwargs["model"], lambda: _litellm().acompletion(**kwargs))
+        content = getattr(resp.choices[0].message, "content", str(resp))
+        if CHAT_CACHE_ENABLED:
+            chat_cache.set(key, {"raw": resp, "content": content})
+        return {"raw": resp, "content": content}
 
-def generate_image(
+    result = await _single_flight("chat", kwargs["model"], key, _fetch)
+    return {**result, "cache": cache_status}
+
+
+def chat_completions(messages, model=None, temperature=None, use_web_search=False, bypass_cache=False):
+    return _run_sync(achat_completions(messages, model, temperature, use_web_search, bypass_cache))
+
+
+async def achat_completions_stream(messages, model=None, temperature=None, use_web_search=False, bypass_cache=False, meta=None):
+    """
+    Streaming variant of chat_completions (stream=True).
+    Yields text deltas (str) as soon as the gateway sends them; the caller
+    is responsible for assembling the full reply.
+    A cache hit is yielded as a single delta. Pass a dict as `meta` to get
+    meta["cache"] filled in ("hit" / "miss" / "bypass" / "disabled").
+    """
+    _, openai_client = _clients()
+    kwargs = {
+        "model": model or DEFAULT_MODEL,
+        "messages": messages,
+        "temperature": DEFAULT_TEMP if temperature is None else temperature,
+        "api_key": API_KEY,
+        "api_base": API_BASE,
+        "custom_llm_provider": "openai",
+        "client": openai_client,
+        "max_retries": 0,  # retries are handled by with_retries
+        "stream": True,
+    }
+    if use_web_search:
+        kwargs["web_search_options"] = {"search_context_size": "medium"}
+    meta = meta if meta is not None else {}
+
+    key = None
+    meta["cache"] = "disabled"
+    if CHAT_CACHE_ENABLED:
+        key = _chat_cache_key(kwargs["model"], messages, kwargs["temperature"], kwargs.get("web_search_options"))
+        meta["cache"] = "bypass" if bypass_cache else "miss"
+        if not bypass_cache:
+            cached = chat_cache.get(key)
+            if cached is not None:
+                meta["cache"] = "hit"
+                if cached["content"]:
+                    yield cached["content"]
+                return
+
+    parts = []
+    stream = await with_retries("chat", kwargs["model"], lambda: _litellm().acompletion(**kwargs))
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = getattr(chunk.choices[0].delta, "content", None)
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if key is not None:
+        content = "".join(parts)
+        chat_cache.set(key, {"raw": {"content": content, "stream": True}, "content": content})
+
+
+def chat_completions_stream(messages, model=None, temperature=None, use_web_search=False, bypass_cache=False, meta=None):
+    yield from _iter_sync(achat_completions_stream(messages, model, temperature, use_web_search, bypass_cache, meta))
+
+
+IMAGE_MAX_CONCURRENCY = int(os.getenv("IMAGE_MAX_CONCURRENCY", "4"))
+_loop_image_slots = weakref.WeakKeyDictionary()
+# models whose gateway route rejected an "n" > 1 request; they get n single calls instead
+_image_n_unsupported = set()
+
+
+def _image_slots():
+    """Per-loop semaphore capping concurrent image requests."""
+    loop = asyncio.get_running_loop()
+    slots = _loop_image_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(IMAGE_MAX_CONCURRENCY)
+        _loop_image_slots[loop] = slots
+    return slots
+
+
+async def _arequest_images(model, content, n=1):
+    """
+    One image request; returns every base64 image found in the response (all choices, all images).
+    """
+    _, openai_client = _clients()
+    extra = {"n": n} if n > 1 else {}
+    async with _image_slots():
+        response = await with_retries("image", model, lambda: openai_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            modalities=["image"],
+            **extra,
+        ))
+
+    if not response or not response.choices:
+        raise ValueError("No choices in response")
+    encoded_images = []
+    for choice in response.choices:
+        for img in getattr(choice.message, "images", None) or []:
+            # Expect a data URL in image_url.url
+            base64_string = img.get("image_url", {}).get("url", "")
+            if base64_string:
+                encoded_images.append(base64_string.split(",", 1)[1] if "," in base64_string else base64_string)
+    if not encoded_images:
+        raise ValueError("No images in response message")
+    return encoded_images
+
+
+async def agenerate_image(
     prompt,
     model="gemini-2.5-flash-image-preview",
     aspect_ratio="1:1",
@@ -53,70 +406,119 @@ def generate_image(
     image_context=None
 ):
     """
-    Generate an image using the OpenAI-compatible chat completions API.
-    (Reverted to the previous working flow that posts a user message with
-     optional image data URLs, and reads back a base64 image from response.)
+    Generate n images using the OpenAI-compatible chat completions API.
+    (Posts a user message with optional image data URLs and reads back base64
+     images from the response.) Every image the gateway returns is used; when one
+     call yields fewer than n, the rest are requested concurrently, capped by
+     IMAGE_MAX_CONCURRENCY. If the gateway rejects "n" > 1 with a client error, the
+     model is remembered and gets n concurrent single calls from then on.
+     Identical concurrent calls share one generation.
+
+    Returns:
+        dict: {"success", "images": [{"image_data", "b64_json"}, ...], plus the
+        first image as "image_data"/"b64_json" for single-image callers}, or an error.
     """
+    n = max(1, int(n or 1))
+    key = cache_key("image", model, prompt, aspect_ratio, n, [content_hash(img) for img in image_context or []])
+    return await _single_flight("image", model, key, lambda: _agenerate_image(prompt, model, aspect_ratio, n, image_context))
+
+
+async def _agenerate_image(prompt, model, aspect_ratio, n, image_context):
     try:
         # Build message content with optional image context
         content = [{"type": "text", "text": prompt}]
         if image_context:
             for img_data in image_context:
-                img_b64 = base64.b64encode(img_data).decode("utf-8")
+                img_b64, mime = _encode_image(img_data)
                 content.append(
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{img_b64}"
+                            "url": f"data:{mime};base64,{img_b64}"
                         },
                     }
                 )
 
-        # Use OpenAI client with chat completions for image generation
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": content}],
-            modalities=["image"],
-        )
+        encoded_images = []
+        if n > 1 and model not in _image_n_unsupported:
+            try:
+                encoded_images = await _arequest_images(model, content, n)
+            except Exception as e:
+                status = status_of(e)
+                if status is None or not 400 <= status < 500 or status == 429:
+                    raise
+                # a client error for n > 1: the route does not take "n", ask for one image per call
+                _image_n_unsupported.add(model)
+                log_json({"type": "api.image_n_unsupported", "model": model, "status_code": status, "error": str(e)[:500]})
 
-        # Process the response
-        if response and response.choices and len(response.choices) > 0:
-            message = response.choices[0].message
-            if hasattr(message, "images") and message.images:
-                # Expect a data URL in image_url.url
-                base64_string = message.images[0].get("image_url", {}).get("url", "")
-                if base64_string:
-                    encoded = base64_string.split(",", 1)[1] if "," in base64_string else base64_string
-                    image_data = base64.b64decode(encoded)
-                    return {
-                        "success": True,
-                        "image_data": image_data,
-                        "b64_json": encoded,
-                        "prompt": prompt,
-                "model": model,
-                "resolution": resolution_to_use,
-                        "aspect_ratio": aspect_ratio,
-                    }
-                else:
-                    return {"success": False, "error": "No base64 image data in response"}
-            else:
-                return {"success": False, "error": "No images in response message"}
-        else:
-            return {"success": False, "error": "No choices in response"}
+        # Fan out for whatever the first call did not return
+        errors = []
+        while len(encoded_images) < n:
+            missing = n - len(encoded_images)
+            batches = await asyncio.gather(
+                *(_arequest_images(model, content) for _ in range(missing)),
+                return_exceptions=True,
+            )
+            got = [img for b in batches if not isinstance(b, BaseException) for img in b]
+            errors.extend(str(b) for b in batches if isinstance(b, BaseException))
+            if not got:
+                break
+            encoded_images.extend(got)
+        if not encoded_images:
+            raise ValueError(errors[0] if errors else "No images in response message")
+
+        images = [{"image_data": base64.b64decode(e), "b64_json": e} for e in encoded_images[:n]]
+        return {
+            "success": True,
+            "images": images,
+            "image_data": images[0]["image_data"],
+            "b64_json": images[0]["b64_json"],
+            "count": len(images),
+            "requested": n,
+            "errors": errors,
+            "prompt": prompt,
+            "model": model,
+            "aspect_ratio": aspect_ratio,
+        }
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def generate_image(
+    prompt,
+    model="gemini-2.5-flash-image-preview",
+    aspect_ratio="1:1",
+    n=1,
+    image_context=None
+):
+    return _run_sync(agenerate_image(prompt, model, aspect_ratio, n, image_context))
+
+
 def save_image(image_data, filename):
-    os.makedirs("generated_images", exist_ok=True)
-    filepath = os.path.join("generated_images", filename)
-    with open(filepath, "wb") as f:
-        f.write(image_data)
-    return filepath
+    # stored once in the blob store; generated_images/ gets a link to it
+    _, blob = blobs.put_bytes(image_data, os.path.splitext(filename)[1] or ".png")
+    return blobs.link_output(blob, os.path.join("generated_images", filename))
+
+
+# Encoded images keyed by content hash: storyboards reuse the same reference/first/last
+# frames across many calls, so each distinct image is base64-encoded only once.
+encoded_image_cache = SizedLRU(int(float(os.getenv("IMAGE_B64_CACHE_MB", "64")) * 1024 * 1024))
+
+
+def _encode_image(img_bytes: bytes) -> tuple:
+    """
+    Return (base64 string, MIME type) for an image, from encoded_image_cache when possible.
+    """
+    key = content_hash(img_bytes)
+    cached = encoded_image_cache.get(key)
+    if cached is None:
+        cached = (base64.b64encode(img_bytes).decode("utf-8"), _detect_mime(img_bytes))
+        encoded_image_cache.set(key, cached, len(cached[0]))
+    return cached
 
 
 def _b64(img_bytes: bytes) -> str:
-    return base64.b64encode(img_bytes).decode("utf-8")
+    return _encode_image(img_bytes)[0]
 
 
 def _detect_mime(img_bytes: bytes) -> str:
@@ -141,17 +543,41 @@ def _detect_mime(img_bytes: bytes) -> str:
     return mapping.get(kind, "image/png")  # safe default if unknown
 
 
+def _redact_images(obj):
+    """
+    Copy of a request payload with base64 image data replaced by its length, for printing.
+    """
+    if isinstance(obj, dict):
+        return {
+            k: (f"<{len(v)} base64 chars>" if k == "bytesBase64Encoded" else _redact_images(v))
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_redact_images(v) for v in obj]
+    return obj
+
+
 def _image_obj(img_bytes: bytes) -> dict:
     """
     Veo image part object with both bytesBase64Encoded and mimeType.
     """
+    encoded, mime = _encode_image(img_bytes)
     return {
-        "bytesBase64Encoded": _b64(img_bytes),
-        "mimeType": _detect_mime(img_bytes),
+        "bytesBase64Encoded": encoded,
+        "mimeType": mime,
     }
 
 
-def generate_video_api_call(
+def _video_headers() -> dict:
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY is not set in environment variables.")
+    return {
+        'Content-Type': 'application/json',
+        'x-goog-api-key': GEMINI_API_KEY
+    }
+
+
+async def astart_video_operation(
     prompt,
     model='veo-3.0-generate-001',
     negative_prompt='blurry, low quality',
@@ -164,14 +590,12 @@ def generate_video_api_call(
     last_frame_image_data=None,         # bytes
 ):
     """
-    Calls the ThucChien AI video generation API.
+    Step 1 of video generation: POST predictLongRunning and return the operation name.
     """
-    if not GEMINI_API_KEY:
-        raise ValueError("GEMINI_API_KEY is not set in environment variables.")
+    headers = _video_headers()
     if not prompt and not first_frame_image_data and not reference_images:
         raise ValueError("Provide at least a prompt or some images (reference/first frame).")
 
-    # Step 1: Start video generation
     step1_url = f'{API_BASE}/gemini/v1beta/models/{model}:predictLongRunning'
 
     # ---- instances[0] ----
@@ -203,76 +627,332 @@ def generate_video_api_call(
         'parameters': parameters
     }
 
-    headers = {
-        'Content-Type': 'application/json',
-        'x-goog-api-key': GEMINI_API_KEY
-    }
-
     print(f"Video Generation Request URL: {step1_url}")
-    print(f"Video Generation Request Payload: {json.dumps(step1_payload, indent=2)}")
+    print(f"Video Generation Request Payload: {json.dumps(_redact_images(step1_payload), indent=2)}")
     print(f"Video Generation Request Headers: {json.dumps(headers, indent=2)}")
 
-    response1 = requests.post(step1_url, json=step1_payload, headers=headers)
-    
-    if response1.status_code != 200:
-        print(f"Video Generation Step 1 Error: {response1.status_code} - {response1.text}")
-        response1.raise_for_status() # Raise an exception for HTTP errors
+    http_client, _ = _clients()
+
+    async def _start():
+        response1 = await http_client.post(step1_url, json=step1_payload, headers=headers)
+        if response1.status_code != 200:
+            print(f"Video Generation Step 1 Error: {response1.status_code} - {response1.text}")
+            response1.raise_for_status() # Raise an exception for HTTP errors
+        return response1
+
+    # a timed-out start may still have created (and billed) an operation: retry rejections only
+    response1 = await with_retries("video_start", model, _start, retry_on=was_rejected)
 
     operation_name = response1.json().get('name')
     if not operation_name:
         raise ValueError('No operation name returned from video generation start.')
+    return operation_name
 
-    # Step 2: Poll for completion (with timeout)
-    max_attempts = 60  # 5 minutes with 5-second intervals
-    attempt = 0
 
-    while attempt < max_attempts:
-        step2_url = f'{API_BASE}/gemini/v1beta/{operation_name}'
-        print(f"Polling URL: {step2_url}")
-        response2 = requests.get(step2_url, headers=headers)
-        
+async def apoll_video_operation(operation_name):
+    """
+    Step 2 of video generation: fetch the operation status once and return its JSON.
+    """
+    headers = _video_headers()
+    step2_url = f'{API_BASE}/gemini/v1beta/{operation_name}'
+    print(f"Polling URL: {step2_url}")
+    http_client, _ = _clients()
+
+    async def _poll():
+        response2 = await http_client.get(step2_url, headers=headers)
         if response2.status_code != 200:
             print(f"Video Generation Step 2 Error: {response2.status_code} - {response2.text}")
             response2.raise_for_status()
+        return response2
 
-        result = response2.json()
-        print(f"Polling Result: {json.dumps(result, indent=2)}")
+    response2 = await with_retries("video_poll", None, _poll)
 
-        if result.get('done'):
-            try:
-                if "response" in result and "generateVideoResponse" in result["response"] and result["response"]["generateVideoResponse"]["generatedSamples"]:
-                    video_uri = result['response']['generateVideoResponse']['generatedSamples'][0]['video']['uri']
-                else:
-                    raise ValueError("No 'generateVideoResponse' found in the completion payload.")
+    result = response2.json()
+    print(f"Polling Result: {json.dumps(result, indent=2)}")
+    return result
 
-                video_id = video_uri.split('/files/')[1].split(':')[0]
-                return {"video_id": video_id, "video_uri": video_uri}
-            except (KeyError, IndexError) as e:
-                print("Unexpected API response:", json.dumps(result, indent=2))
-                raise ValueError(f"Invalid response format from video generation status: {e}")
 
-        attempt += 1
-        time.sleep(5)
+async def acancel_video_operation(operation_name):
+    """
+    Best-effort cancel of a long-running operation (POST <operation>:cancel).
+    """
+    headers = _video_headers()
+    http_client, _ = _clients()
+    response = await http_client.post(f'{API_BASE}/gemini/v1beta/{operation_name}:cancel', headers=headers)
+    response.raise_for_status()
 
-    raise TimeoutError('Video generation timeout.')
 
+def parse_video_operation(result: dict) -> dict:
+    """
+    Extract {"video_id", "video_uri"} from a finished operation payload.
+    """
+    if result.get("error"):
+        raise ValueError(f"Video generation failed: {result['error']}")
+    try:
+        if "response" in result and "generateVideoResponse" in result["response"] and result["response"]["generateVideoResponse"]["generatedSamples"]:
+            video_uri = result['response']['generateVideoResponse']['generatedSamples'][0]['video']['uri']
+        else:
+            raise ValueError("No 'generateVideoResponse' found in the completion payload.")
 
-def download_video_api_call(video_id):
+        video_id = video_uri.split('/files/')[1].split(':')[0]
+        return {"video_id": video_id, "video_uri": video_uri}
+    except (KeyError, IndexError) as e:
+        print("Unexpected API response:", json.dumps(result, indent=2))
+        raise ValueError(f"Invalid response format from video generation status: {e}")
+
+
+# ---- Video job manager (see src/video_jobs.py) ----
+VIDEO_TIMEOUT_S = float(os.getenv("VIDEO_TIMEOUT_S", "300"))
+
+
+async def _on_api_loop(coro):
+    """
+    Await a coroutine on the shared API loop (where the video job manager lives),
+    bridging from another event loop if needed.
+    """
+    loop = _get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+async def _manager_call(method, *args, **kwargs):
+    from .video_jobs import get_manager
+
+    async def _call():
+        result = getattr(get_manager(), method)(*args, **kwargs)
+        return await result if asyncio.iscoroutine(result) else result
+
+    return await _on_api_loop(_call())
+
+
+async def asubmit_video_job(prompt, meta=None, **params):
+    """
+    Start a video generation and record it in the durable job journal.
+    Accepts the same keyword params as astart_video_operation. Returns the job id.
+    """
+    operation_name = await astart_video_operation(prompt, **params)
+    return await _manager_call("submit", operation_name, {"prompt": prompt, "model": params.get("model"), **(meta or {})})
+
+
+async def await_video_job(job_id, timeout=None):
+    """
+    Wait for a job to finish and return {"video_id", "video_uri"}.
+    On timeout the job keeps running in the background and can be resumed by id.
+    """
+    try:
+        job = await _manager_call("wait", job_id, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Video generation timeout (job {job_id} is still pending).")
+    if job["status"] != "done":
+        raise ValueError(job.get("error") or f"Video job {job_id} ended with status '{job['status']}'.")
+    return job["result"]
+
+
+async def acancel_video_job(job_id):
+    return await _manager_call("cancel", job_id)
+
+
+def submit_video_job(prompt, meta=None, **params):
+    return _run_sync(asubmit_video_job(prompt, meta=meta, **params))
+
+
+def video_job_status(job_id):
+    return _run_sync(_manager_call("status", job_id))
+
+
+def list_video_jobs(status=None):
+    return _run_sync(_manager_call("list", status))
+
+
+def cancel_video_job(job_id):
+    return _run_sync(acancel_video_job(job_id))
+
+
+async def _aresume_video_job(match: dict):
+    """
+    Result of an earlier job with the same meta (pending or recently done), so a re-run
+    does not pay for the same video twice; None when there is no such job or it failed.
+    """
+    job_id = await _manager_call("find", match)
+    if job_id is None:
+        return None
+    try:
+        result = await await_video_job(job_id, VIDEO_TIMEOUT_S)
+    except ValueError:
+        return None  # failed/cancelled/expired: start a new one
+    return {**result, "job_id": job_id, "resumed": True}
+
+
+def resume_video_jobs():
+    """
+    Load the job journal and resume polling pending operations (e.g. after a restart).
+    Resumed jobs that belong to a conversation are downloaded and added to it when they
+    finish (see src/video_jobs.py). Returns the jobs that are still pending.
+    """
+    return list_video_jobs("pending")
+
+
+async def agenerate_video_api_call(
+    prompt,
+    model='veo-3.0-generate-001',
+    negative_prompt='blurry, low quality',
+    aspect_ratio='16:9',
+    resolution='1080p',
+    person_generation='allow_all',
+    duration_seconds=8,
+    reference_images=None,              # list[bytes] (max 3)
+    first_frame_image_data=None,        # bytes
+    last_frame_image_data=None,         # bytes
+    timeout=VIDEO_TIMEOUT_S,
+    meta=None,
+):
+    """
+    Calls the ThucChien AI video generation API.
+    The operation is tracked by the video job manager, which polls it with
+    adaptive backoff; the result includes the job id.
+    """
+    job_id = await asubmit_video_job(
+        prompt,
+        meta=meta,
+        model=model,
+        negative_prompt=negative_prompt,
+        aspect_ratio=aspect_ratio,
+        resolution=resolution,
+        person_generation=person_generation,
+        duration_seconds=duration_seconds,
+        reference_images=reference_images,
+        first_frame_image_data=first_frame_image_data,
+        last_frame_image_data=last_frame_image_data,
+    )
+    result = await await_video_job(job_id, timeout)
+    return {**result, "job_id": job_id}
+
+
+def generate_video_api_call(
+    prompt,
+    model='veo-3.0-generate-001',
+    negative_prompt='blurry, low quality',
+    aspect_ratio='16:9',
+    resolution='1080p',
+    person_generation='allow_all',
+    duration_seconds=8,
+    reference_images=None,
+    first_frame_image_data=None,
+    last_frame_image_data=None,
+    timeout=VIDEO_TIMEOUT_S,
+    meta=None,
+):
+    return _run_sync(agenerate_video_api_call(
+        prompt,
+        model=model,
+        negative_prompt=negative_prompt,
+        aspect_ratio=aspect_ratio,
+        resolution=resolution,
+        person_generation=person_generation,
+        duration_seconds=duration_seconds,
+        reference_images=reference_images,
+        first_frame_image_data=first_frame_image_data,
+        last_frame_image_data=last_frame_image_data,
+        timeout=timeout,
+        meta=meta,
+    ))
+
+
+async def adownload_video_api_call(video_id):
     """
     Downloads a video given its video_id. Returns raw bytes.
+    Kept for callers that want bytes: the transfer goes through adownload_video_to_file
+    (streamed to a temp file, resumed and size-checked) and is read back. Prefer
+    adownload_video_to_file, which never holds the whole video in memory.
+    """
+    with tempfile.TemporaryDirectory(prefix="video_download_") as tmp:
+        path = await adownload_video_to_file(video_id, os.path.join(tmp, f"{video_id}.mp4"))
+        return await asyncio.to_thread(Path(path).read_bytes)
+
+
+def download_video_api_call(video_id):
+    return _run_sync(adownload_video_api_call(video_id))
+
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("VIDEO_DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+DOWNLOAD_MAX_RETRIES = int(os.getenv("VIDEO_DOWNLOAD_MAX_RETRIES", "3"))
+
+
+def _total_from_headers(resp, offset: int):
+    """
+    Expected full file size from Content-Range (206) or Content-Length (200), if known.
+    """
+    content_range = resp.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        return int(total) if total.isdigit() else None
+    length = resp.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length) + (offset if resp.status_code == 206 else 0)
+    return None
+
+
+async def adownload_video_to_file(video_id, dest_path, chunk_size=DOWNLOAD_CHUNK_SIZE, max_retries=DOWNLOAD_MAX_RETRIES):
+    """
+    Stream a video straight to disk without holding it in memory.
+    Bytes go to <dest_path>.part; an interrupted transfer (in this call or a previous run)
+    resumes with an HTTP Range request. The final size is checked against the server's
+    Content-Length/Content-Range before the file is atomically renamed to dest_path.
+    Returns dest_path.
     """
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY is not set in environment variables.")
 
     download_url = f"{API_BASE}/gemini/download/v1beta/files/{video_id}:download?alt=media"
-    headers = {"x-goog-api-key": GEMINI_API_KEY}
-    response = requests.get(download_url, headers=headers, stream=True)
-    response.raise_for_status()
-    return response.content
+    dest_dir = os.path.dirname(dest_path)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    part_path = f"{dest_path}.part"
+    http_client, _ = _clients()
 
+    async def _fetch():
+        """One (resumed) transfer into part_path; returns the expected total size if known."""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # identity encoding keeps Range offsets and sizes in raw file bytes
+        headers = {"x-goog-api-key": GEMINI_API_KEY, "Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        async with http_client.stream("GET", download_url, headers=headers) as resp:
+            if resp.status_code == 416 and offset:
+                # Nothing left to fetch: the .part file may already be complete
+                return _total_from_headers(resp, offset)
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                offset = 0  # server ignored the Range header, start over
+            expected = _total_from_headers(resp, offset)
+            with open(part_path, "ab" if offset else "wb") as f:
+                async for chunk in resp.aiter_bytes(chunk_size=chunk_size):
+                    f.write(chunk)
+            return expected
 
-def generate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', duration=8, negative_prompt='blurry, low quality',
-                            person_generation='allow_all', reference_images=None, first_frame_image_data=None, last_frame_image_data=None):
+    attempt = 0
+    while True:
+        # transport errors and 429/5xx are retried (and resumed) by with_retries
+        expected = await with_retries("download", None, _fetch, max_attempts=max_retries + 1)
+        size = os.path.getsize(part_path)
+        if expected is not None and size != expected:
+            attempt += 1
+            if size > expected or attempt > max_retries:
+                os.remove(part_path)
+                raise IOError(f"Downloaded size mismatch for {video_id}: got {size} bytes, expected {expected}.")
+            continue
+        os.replace(part_path, dest_path)
+        return dest_path
+
+
+def download_video_to_file(video_id, dest_path, chunk_size=DOWNLOAD_CHUNK_SIZE, max_retries=DOWNLOAD_MAX_RETRIES):
+    return _run_sync(adownload_video_to_file(video_id, dest_path, chunk_size, max_retries))
+
+
+async def agenerate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', duration=8, negative_prompt='blurry, low quality',
+                            person_generation='allow_all', reference_images=None, first_frame_image_data=None, last_frame_image_data=None,
+                            meta=None, output_path=None, resume=False):
     """
     Orchestrates the video generation and download process.
     
@@ -286,9 +966,13 @@ def generate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', du
         reference_images (list): List of reference image data bytes.
         first_frame_image_data (bytes): First frame image data bytes.
         last_frame_image_data (bytes): Last frame image data bytes.
+        meta (dict): Extra fields recorded with the video job (e.g. conversationId).
+        output_path (str): Where to save the MP4. Defaults to generated_videos/generated_video_<ts>.mp4.
+        resume (bool): Reuse a pending or recently finished job with the same prompt, model,
+            meta and output_path from the job journal instead of starting a new one.
         
     Returns:
-        dict: Contains the generated video data and metadata, or an error.
+        dict: Contains the saved video path and metadata, or an error.
     """
     try:
         # Simple resolution heuristic
@@ -297,7 +981,13 @@ def generate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', du
         else:
             resolution_to_use = "720p"
         
-        video_gen_result = generate_video_api_call(
+        if not output_path:
+            output_path = os.path.join("generated_videos", f"generated_video_{int(time.time())}.mp4")
+        meta = {**(meta or {}), "output_path": output_path}
+        video_gen_result = None
+        if resume:
+            video_gen_result = await _aresume_video_job({**meta, "prompt": prompt, "model": model})
+        video_gen_result = video_gen_result or await agenerate_video_api_call(
             prompt=prompt,
             model=model,
             aspect_ratio=aspect_ratio,
@@ -308,16 +998,23 @@ def generate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', du
             reference_images=reference_images,
             first_frame_image_data=first_frame_image_data,
             last_frame_image_data=last_frame_image_data,
+            # output_path is recorded so a job that outlives this call can still be delivered
+            meta=meta,
         )
         
         if video_gen_result and "video_id" in video_gen_result:
             video_id = video_gen_result["video_id"]
-            video_data = download_video_api_call(video_id)
+            video_path = await adownload_video_to_file(video_id, output_path)
+            # keep one copy per distinct video; output_path becomes a link to the blob
+            video_blob, _ = await asyncio.to_thread(blobs.adopt_output, video_path)
             
             return {
                 "success": True,
-                "video_data": video_data,
+                "video_path": video_path,
+                "video_blob": video_blob,
                 "video_id": video_id,
+                "job_id": video_gen_result.get("job_id"),
+                "resumed": bool(video_gen_result.get("resumed")),
                 "prompt": prompt,
                 "model": model,
                 "resolution": resolution_to_use,
@@ -340,24 +1037,218 @@ def generate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', du
             "error": str(e)
         }
 
-def text_to_speech(
+
+def generate_video(prompt, model='veo-3.0-generate-001', aspect_ratio='16:9', duration=8, negative_prompt='blurry, low quality',
+                            person_generation='allow_all', reference_images=None, first_frame_image_data=None, last_frame_image_data=None,
+                            meta=None, output_path=None, resume=False):
+    return _run_sync(agenerate_video(
+        prompt,
+        model=model,
+        aspect_ratio=aspect_ratio,
+        duration=duration,
+        negative_prompt=negative_prompt,
+        person_generation=person_generation,
+        reference_images=reference_images,
+        first_frame_image_data=first_frame_image_data,
+        last_frame_image_data=last_frame_image_data,
+        meta=meta,
+        output_path=output_path,
+        resume=resume,
+    ))
+
+
+# ---- Text to speech ----
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "600"))
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+_loop_tts_slots = weakref.WeakKeyDictionary()
+
+_TTS_EXT = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/ogg": "ogg",
+    "audio/opus": "opus",
+    "audio/webm": "webm",
+    "audio/aac": "aac",
+    "audio/flac": "flac",
+}
+_SENTENCE_END = ".!?…。\n"
+
+# Content-addressed audio cache, keyed by (API base, normalized text, model, voice); disable with
+# TTS_CACHE=0 or per call with bypass_cache=True.
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE", "1") == "1"
+tts_cache = BlobCache(CACHE_DIR / "tts", max_bytes=int(float(os.getenv("TTS_CACHE_MB", "500")) * 1024 * 1024))
+
+
+def _tts_cache_key(text: str, model: str, voice: str) -> str:
+    # NFC + collapsed whitespace, so re-pasted or re-wrapped scripts still hit
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return cache_key("tts", API_BASE, normalized, model, voice)
+
+
+def _tts_slots():
+    """Per-loop semaphore capping concurrent TTS chunk requests."""
+    loop = asyncio.get_running_loop()
+    slots = _loop_tts_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+        _loop_tts_slots[loop] = slots
+    return slots
+
+
+def split_tts_text(text: str, max_chars: int = TTS_CHUNK_CHARS) -> list:
+    """
+    Split text into chunks of at most max_chars, on sentence boundaries where possible.
+    Sentences longer than max_chars are split on commas, then on spaces.
+    """
+    sentences = []
+    current = ""
+    for ch in text:
+        current += ch
+        if ch in _SENTENCE_END:
+            sentences.append(current)
+            current = ""
+    if current:
+        sentences.append(current)
+
+    def _pieces(sentence):
+        if len(sentence) <= max_chars:
+            return [sentence]
+        tokens = []
+        clauses = sentence.split(", ")
+        for k, clause in enumerate(clauses):
+            sep = ", " if k < len(clauses) - 1 else ""
+            if len(clause) + len(sep) <= max_chars:
+                tokens.append(clause + sep)
+            else:
+                words = clause.split(" ")
+                tokens.extend(w + " " for w in words[:-1])
+                tokens.append(words[-1] + sep)
+        pieces, buf = [], ""
+        for token in tokens:
+            if buf and len(buf) + len(token) > max_chars:
+                pieces.append(buf)
+                buf = ""
+            buf += token
+        if buf:
+            pieces.append(buf)
+        return pieces
+
+    chunks, buf = [], ""
+    for sentence in sentences:
+        for piece in _pieces(sentence):
+            if buf and len(buf) + len(piece) > max_chars:
+                chunks.append(buf.strip())
+                buf = ""
+            buf += piece
+    if buf.strip():
+        chunks.append(buf.strip())
+    return [c for c in chunks if c]
+
+
+def _tts_output_file(content_type: str, audio_format: str, filename: str | None, voice: str) -> tuple:
+    """
+    Create a new file in generativeAudios/ and return (path, open binary file). An existing
+    file is never reused (it may be another call's audio, or a hard link into the TTS cache):
+    a taken name gets a _2, _3, ... suffix.
+    """
+    os.makedirs("generativeAudios", exist_ok=True)
+    # Pick extension from content-type when possible
+    ext = _TTS_EXT.get(content_type.lower(), audio_format.lower() if audio_format else "mp3")
+    if not filename:
+        safe_voice = "".join(c for c in voice if c.isalnum() or c in ("-", "_")).strip() or "voice"
+        stem = f"tts_{safe_voice}_{int(time.time())}"
+    elif filename.lower().endswith(f".{ext}"):
+        stem = filename[:-len(ext) - 1]
+    else:
+        stem = filename  # the extension follows what we think we're saving
+    for i in itertools.count(1):
+        path = os.path.join("generativeAudios", f"{stem}.{ext}" if i == 1 else f"{stem}_{i}.{ext}")
+        try:
+            return path, open(path, "xb")
+        except FileExistsError:
+            continue
+
+
+async def _atts_open(text: str, model: str, voice: str, timeout: int):
+    """POST /audio/speech under the rate limiter; returns the open streaming response."""
+    http_client, _ = _clients()
+    url = f"{API_BASE}/audio/speech"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {API_KEY}",
+    }
+    payload = {
+        "model": model,
+        "input": text,
+        "voice": voice,
+    }
+
+    async def _open():
+        # 429/5xx are raised here so with_retries can back off and try again
+        request = http_client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+        resp = await http_client.send(request, stream=True)
+        if resp.status_code in RETRY_STATUSES:
+            await resp.aread()
+            await resp.aclose()
+            resp.raise_for_status()
+        return resp
+
+    return await with_retries("tts", model, _open)
+
+
+async def _tts_error(resp) -> dict:
+    """Diagnostics for a non-audio response (JSON error or meta)."""
+    await resp.aread()
+    try:
+        data = resp.json()
+    except Exception:
+        data = {"message": resp.text[:500]}
+    return {
+        "success": False,
+        "status_code": resp.status_code,
+        "content_type": resp.headers.get("Content-Type", ""),
+        "error": data.get("error") or data.get("message") or "Unexpected non-audio response.",
+    }
+
+
+async def atext_to_speech(
     input_text: str,
     model: str = "gemini-2.5-flash-preview-tts",
     voice: str = "Zephyr",
     audio_format: str = "mp3",   # only used to hint the filename if server returns generic type
     filename: str | None = None,
     timeout: int = 120,
+    chunked: bool | None = None,
+    on_first_chunk=None,
+    bypass_cache: bool = False,
 ):
     """
     Convert text to speech via ThucChien AI gateway and save the audio locally.
 
+    Texts longer than TTS_CHUNK_CHARS (or chunked=True) are split on sentence boundaries
+    and synthesized concurrently (at most TTS_MAX_CONCURRENCY requests), then joined in
+    order into one file. The first chunk is written as soon as it arrives and
+    on_first_chunk(path) is called, so playback can start early.
+
+    Results are cached by (API base, normalized text, model, voice) in data/cache/tts/
+    as hard links to the output files; a hit links (or copies) the cached audio to a new
+    output file in generativeAudios/ and returns it with "cache": "hit".
+
     Args:
         input_text: Text to synthesize.
         model: TTS model id. Example: "gemini-2.5-flash-preview-tts".
         voice: Voice preset. Example: "Zephyr".
         audio_format: Expected file extension fallback (e.g., "mp3", "wav", "ogg").
         filename: Optional output filename (without path). If None, one is generated.
-        timeout: Request timeout in seconds.
+            Existing files are never overwritten: a taken name gets a _2, _3, ... suffix.
+        timeout: Request timeout in seconds (per chunk in chunked mode).
+        chunked: Force (True) or disable (False) chunked mode; None decides by length.
+        on_first_chunk: Optional callback(path) once the first audio chunk is on disk. It
+            runs on the API event-loop thread, not the caller's: Tk code must hand off
+            to the UI thread with widget.after(0, ...). Keep it short, it blocks the loop.
+        bypass_cache: Skip the cache lookup (the new audio still refreshes the entry).
 
     Returns:
         dict:
@@ -367,75 +1258,98 @@ def text_to_speech(
                 "content_type": "audio/mpeg",
                 "status_code": 200,
                 "bytes": <int>,
+                "chunks": <int>,
+                "cache": "hit" | "miss" | "bypass" | "disabled",
                 "error": "..." (when failed),
             }
     """
+    key = None
+    cache_status = "disabled"
+    if TTS_CACHE_ENABLED:
+        key = _tts_cache_key(input_text, model, voice)
+        cache_status = "bypass" if bypass_cache else "miss"
+        if not bypass_cache:
+            cached = tts_cache.get(key)
+            if cached is not None:
+                return _tts_cache_hit(cached, filename, voice, model, on_first_chunk)
+
     if not API_KEY:
         return {"success": False, "error": "THUCCHIEN_API_KEY is not set.", "status_code": 0}
 
-    url = f"{API_BASE}/audio/speech"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}",
-    }
-    payload = {
+    async def _synthesize():
+        result = await _atext_to_speech(input_text, model, voice, audio_format, filename, timeout, chunked, on_first_chunk)
+        if result.get("success") and key is not None:
+            try:
+                # only what this call received: the digest check rejects a file changed since
+                tts_cache.put(key, result["path"], os.path.splitext(result["path"])[1],
+                              link=blobs.BLOB_LINK_OUTPUTS, digest=result["content_hash"])
+            except (OSError, ValueError):
+                pass  # caching is best effort
+        return result
+
+    if on_first_chunk is not None:
+        # followers would never see their callback fire, so these calls are not shared
+        result = await _synthesize()
+    else:
+        flight_key = cache_key("tts", _tts_cache_key(input_text, model, voice), audio_format, filename, chunked)
+        result = await _single_flight("tts", model, flight_key, _synthesize)
+    return {**result, "cache": cache_status}
+
+
+def _tts_cache_hit(cached, filename, voice, model, on_first_chunk) -> dict:
+    # Callers keep, move or delete the returned file, so it must not be the cache entry
+    # itself (eviction would pull it away): hand out a link (or copy) in generativeAudios
+    path, f = _tts_output_file("", cached.suffix.lstrip("."), filename, voice)
+    f.close()
+    path = blobs.link_output(cached, path)  # replaces the empty file reserved above
+    if on_first_chunk:
+        on_first_chunk(path)
+    ext = cached.suffix.lstrip(".")
+    content_type = next((ct for ct, e in _TTS_EXT.items() if e == ext), "")
+    return {
+        "success": True,
+        "status_code": 200,
+        "content_type": content_type,
+        "path": path,
+        "bytes": cached.stat().st_size,
         "model": model,
-        "input": input_text,
         "voice": voice,
+        "cache": "hit",
     }
 
+
+async def _atext_to_speech(input_text, model, voice, audio_format, filename, timeout, chunked, on_first_chunk):
+    if chunked is None:
+        chunked = len(input_text) > TTS_CHUNK_CHARS
+    if chunked:
+        chunks = split_tts_text(input_text)
+        if len(chunks) > 1:
+            return await _atext_to_speech_chunked(chunks, model, voice, audio_format, filename, timeout, on_first_chunk)
+
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=timeout, stream=True)
-        status = resp.status_code
-        content_type = resp.headers.get("Content-Type", "")
+        resp = await _atts_open(input_text, model, voice, timeout)
+        try:
+            status = resp.status_code
+            content_type = resp.headers.get("Content-Type", "")
 
-        # If server sends JSON error or meta
-        if not content_type.startswith("audio/"):
-            # Try to parse JSON for diagnostics
-            try:
-                data = resp.json()
-            except Exception:
-                data = {"message": resp.text[:500]}
-            return {
-                "success": False,
-                "status_code": status,
-                "content_type": content_type,
-                "error": data.get("error") or data.get("message") or "Unexpected non-audio response.",
-            }
+            # If server sends JSON error or meta
+            if not content_type.startswith("audio/"):
+                return await _tts_error(resp)
 
-        # Prepare output path
-        os.makedirs("generativeAudios", exist_ok=True)
-
-        # Pick extension from content-type when possible
-        ext_map = {
-            "audio/mpeg": "mp3",
-            "audio/mp3": "mp3",
-            "audio/wav": "wav",
-            "audio/x-wav": "wav",
-            "audio/ogg": "ogg",
-            "audio/opus": "opus",
-            "audio/webm": "webm",
-            "audio/aac": "aac",
-            "audio/flac": "flac",
-        }
-        ext = ext_map.get(content_type.lower(), audio_format.lower() if audio_format else "mp3")
-
-        if not filename:
-            safe_voice = "".join(c for c in voice if c.isalnum() or c in ("-", "_")).strip() or "voice"
-            ts = int(time.time())
-            filename = f"tts_{safe_voice}_{ts}.{ext}"
-        elif not filename.lower().endswith(f".{ext}"):
-            # ensure extension matches what we think we're saving
-            filename = f"{filename}.{ext}"
-
-        out_path = os.path.join("generativeAudios", filename)
-
-        # Write bytes
-        with open(out_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+            out_path, f = _tts_output_file(content_type, audio_format, filename, voice)
+
+            # Write bytes
+            digest = hashlib.blake2b(digest_size=20)  # same hash as cache.content_hash
+            with f:
+                async for chunk in resp.aiter_bytes(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+        finally:
+            await resp.aclose()
 
+        if on_first_chunk:
+            on_first_chunk(out_path)
         file_size = os.path.getsize(out_path)
         return {
             "success": True,
@@ -443,8 +1357,122 @@ def text_to_speech(
             "content_type": content_type,
             "path": out_path,
             "bytes": file_size,
+            "content_hash": digest.hexdigest(),
+            "chunks": 1,
             "model": model,
             "voice": voice,
         }
-    except requests.RequestException as e:
+    except httpx.HTTPStatusError as e:
+        return {"success": False, "error": str(e), "status_code": e.response.status_code}
+    except httpx.HTTPError as e:
         return {"success": False, "error": str(e), "status_code": 0}
+
+
+async def _atts_chunk(text: str, model: str, voice: str, timeout: int) -> dict:
+    async with _tts_slots():
+        resp = await _atts_open(text, model, voice, timeout)
+        try:
+            content_type = resp.headers.get("Content-Type", "")
+            if not content_type.startswith("audio/"):
+                return await _tts_error(resp)
+            return {"success": True, "status_code": resp.status_code, "content_type": content_type, "data": await resp.aread()}
+        finally:
+            await resp.aclose()
+
+
+def _wav_split(data: bytes) -> tuple:
+    """Split a WAV file into (header up to and including the data chunk header, frames)."""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("TTS chunk is not a RIFF/WAVE file")
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], int.from_bytes(data[pos + 4:pos + 8], "little")
+        if chunk_id == b"data":
+            # streamed WAVs may carry a placeholder size (0 / 0xFFFFFFFF): take what is there
+            return data[:pos + 8], data[pos + 8:pos + 8 + size] if 0 < size < len(data) else data[pos + 8:]
+        pos += 8 + size + (size & 1)
+    raise ValueError("TTS chunk has no WAV data chunk")
+
+
+def _patch_wav_sizes(f, header_len: int):
+    """Fix the RIFF and data sizes of a WAV file whose frames were appended after the header."""
+    total = f.seek(0, os.SEEK_END)
+    f.seek(4)
+    f.write((total - 8).to_bytes(4, "little"))
+    f.seek(header_len - 4)
+    f.write((total - header_len).to_bytes(4, "little"))
+
+
+async def _atext_to_speech_chunked(chunks, model, voice, audio_format, filename, timeout, on_first_chunk):
+    start = time.time()
+    # Tasks start in order and the semaphore is FIFO, so chunk 0 is requested first
+    tasks = [asyncio.ensure_future(_atts_chunk(c, model, voice, timeout)) for c in chunks]
+    out_path = None
+    first_chunk_ms = None
+    try:
+        for i, task in enumerate(tasks):
+            result = await task
+            if not result.get("success"):
+                return {**result, "chunks": len(chunks), "failed_chunk": i}
+            data = result["data"]
+            if out_path is None:
+                content_type = result["content_type"]
+                is_wav = _TTS_EXT.get(content_type.lower()) == "wav"
+                out_path, f = _tts_output_file(content_type, audio_format, filename, voice)
+                if is_wav:
+                    wav_header, frames = _wav_split(data)  # later chunks only contribute frames
+                    data = wav_header + frames
+            elif is_wav:
+                data = _wav_split(data)[1]
+            # MP3/AAC/Ogg streams play back correctly when concatenated
+            f.write(data)
+            f.flush()
+            if i == 0:
+                first_chunk_ms = int((time.time() - start) * 1000)
+                if on_first_chunk:
+                    on_first_chunk(out_path)
+        if is_wav:
+            _patch_wav_sizes(f, len(wav_header))
+        f.close()
+        digest = await asyncio.to_thread(file_hash, out_path)  # our own exclusively created file
+    except httpx.HTTPStatusError as e:
+        return {"success": False, "error": str(e), "status_code": e.response.status_code, "chunks": len(chunks)}
+    except httpx.HTTPError as e:
+        return {"success": False, "error": str(e), "status_code": 0, "chunks": len(chunks)}
+    except ValueError as e:
+        return {"success": False, "error": str(e), "status_code": 200, "chunks": len(chunks)}
+    finally:
+        for task in tasks:
+            task.cancel()
+        if out_path is not None and not f.closed:
+            # a chunk failed: do not leave a truncated file behind
+            f.close()
+            os.remove(out_path)
+
+    return {
+        "success": True,
+        "status_code": 200,
+        "content_type": content_type,
+        "path": out_path,
+        "bytes": os.path.getsize(out_path),
+        "content_hash": digest,
+        "chunks": len(chunks),
+        "first_chunk_ms": first_chunk_ms,
+        "elapsed_ms": int((time.time() - start) * 1000),
+        "model": model,
+        "voice": voice,
+    }
+
+
+def text_to_speech(
+    input_text: str,
+    model: str = "gemini-2.5-flash-preview-tts",
+    voice: str = "Zephyr",
+    audio_format: str = "mp3",
+    filename: str | None = None,
+    timeout: int = 120,
+    chunked: bool | None = None,
+    on_first_chunk=None,
+    bypass_cache: bool = False,
+):
+    return _run_sync(atext_to_speech(input_text, model, voice, audio_format, filename, timeout, chunked, on_first_chunk, bypass_cache))
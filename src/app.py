@@ -1,12 +1,11 @@
-from InquirerPy import inquirer
-from InquirerPy.separator import Separator
 from src.paths import ensure_all_dirs
 from src.conversations import list_conversations, create_conversation, load_conversation, append_message
 from src.api import chat_completions
+from src.context import build_context
 from src.logger import log_json
 import os
+import sys
 from dotenv import load_dotenv
-from src.gui import launch
 
 load_dotenv()
 
@@ -22,7 +21,12 @@ AVAILABLE_MODELS = [
     {"name": "Gemini 2.5 Pro Preview TTS", "value": "gemini-2.5-pro-preview-tts"},
 ]
 
+# InquirerPy is only needed by the terminal menus, so it is imported there rather than
+# at startup (the default entry point is the GUI).
 def pick_conversation():
+    from InquirerPy import inquirer
+    from InquirerPy.separator import Separator
+
     convs = list_conversations()
     choices = [("➕ Create new conversation", "__new__")]
     for c in convs:
@@ -38,13 +42,19 @@ def pick_conversation():
     return load_conversation(sel)
 
 def pick_api():
+    from InquirerPy import inquirer
+
     apis = [("Chat Completions (/chat/completions)", "chat")]
     return inquirer.select(message="Choose API:", choices=apis).execute()
 
 def pick_model():
+    from InquirerPy import inquirer
+
     return inquirer.select(message="Choose AI model:", choices=[(m["name"], m["value"]) for m in AVAILABLE_MODELS], default=DEFAULT_MODEL).execute()
 
 def chat_loop(conv: dict, selected_model: str):
+    from InquirerPy import inquirer
+
     print(f"\n💬 Using: {conv['name']} (id: {conv['id']}) with model: {selected_model}")
     print("Type /exit to return to menu.\n")
     while True:
@@ -55,16 +65,19 @@ def chat_loop(conv: dict, selected_model: str):
         append_message(conv, "user", prompt)
         try:
             start = __import__("time").time()
-            result = chat_completions([{"role": m["role"], "content": m["content"]} for m in conv["messages"]], model=selected_model)
+            context = build_context(conv, selected_model)
+            result = chat_completions(context["messages"], model=selected_model)
             content = result["content"]
             append_message(conv, "assistant", content)
 
             log_path = log_json({
                 "type": "chat.completions",
                 "conversationId": conv["id"],
-                "request": {"messages": [{"role": m["role"], "content": m["content"]} for m in conv["messages"][:-1]]},
+                "request": {"messages": context["messages"]},
                 "response": result["raw"],
                 "latency_ms": int((__import__("time").time() - start) * 1000),
+                "cache": result.get("cache"),
+                "context": {k: v for k, v in context.items() if k != "messages"},
             })
 
             print(f"\n🤖 Assistant:\n{content}\n")
@@ -79,6 +92,18 @@ def chat_loop(conv: dict, selected_model: str):
 
 
 def main():
+    if "--startup-report" in sys.argv:
+        from src.startup import main as startup_report
+
+        sys.exit(startup_report(sys.argv[sys.argv.index("--startup-report") + 1:]))
+
+    if "--batch" in sys.argv:
+        from src.batch import main as batch_main
+
+        sys.exit(batch_main(sys.argv[sys.argv.index("--batch") + 1:]))
+
+    from src.gui import launch
+
     launch()
 
 if __name__ == "__main__":
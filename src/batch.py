@@ -0,0 +1,245 @@
+# src/batch.py
+"""
+Headless batch runner.
+
+    python -m src.batch jobs.jsonl --out batch_output/run1
+    python -m src.app --batch jobs.jsonl --out batch_output/run1
+
+Each line of the input is one job:
+
+    {"id": "intro", "kind": "chat", "prompt": "...", "model": "gemini-2.5-pro"}
+    {"id": "poster", "kind": "image", "prompt": "...", "n": 2, "images": ["ref.png"]}
+    {"id": "scene1", "kind": "video", "prompt": "...", "aspect_ratio": "16:9", "first_frame": "f.png"}
+    {"id": "voice1", "kind": "tts", "text": "...", "voice": "Zephyr"}
+
+Chat jobs take "prompt" or a full "messages" list. Jobs run concurrently with a cap per
+kind (BATCH_CONCURRENCY_<KIND> or --concurrency chat=8,video=2). Every finished job is
+appended to <out>/results.jsonl and logged via log_json; artifacts go to
+<out>/artifacts/<job id>/. Re-running with the same --out skips jobs already "done", so
+a crashed run picks up where it stopped (failed jobs are retried). Video jobs that the
+crashed run already started are taken from the video job journal instead of being
+submitted again.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+from pathlib import Path
+
+from . import api
+from .cache import cache_key
+from .logger import log_json
+
+KINDS = ("chat", "image", "video", "tts")
+DEFAULT_CONCURRENCY = {"chat": 4, "image": 2, "video": 2, "tts": 2}
+
+
+def concurrency_limits(overrides: dict | None = None) -> dict:
+    limits = {k: int(os.getenv(f"BATCH_CONCURRENCY_{k.upper()}", v)) for k, v in DEFAULT_CONCURRENCY.items()}
+    limits.update(overrides or {})
+    return limits
+
+
+def load_jobs(path) -> list:
+    """
+    Parse a JSONL job file. Jobs without an "id" get one derived from their content,
+    so it stays the same across re-runs; duplicate ids keep the first job.
+    """
+    jobs, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{lineno}: invalid JSON ({e})")
+            if job.get("kind") not in KINDS:
+                raise ValueError(f"{path}:{lineno}: kind must be one of {', '.join(KINDS)}")
+            job["id"] = str(job.get("id") or cache_key("batch", job)[:16])
+            if job["id"] in seen:
+                continue
+            seen.add(job["id"])
+            jobs.append(job)
+    return jobs
+
+
+def completed_ids(results_path: Path) -> set:
+    done = set()
+    if not results_path.exists():
+        return done
+    for line in results_path.read_text(encoding="utf-8").splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # torn last line from a crash
+        if entry.get("status") == "done":
+            done.add(entry["id"])
+    return done
+
+
+def _read_image(path: str | None, base_dir: Path) -> bytes | None:
+    if not path:
+        return None
+    p = Path(path)
+    return (p if p.is_absolute() else base_dir / p).read_bytes()
+
+
+# ---------- Job kinds ----------
+async def _run_chat(job: dict, artifacts: Path, base_dir: Path) -> dict:
+    messages = job.get("messages") or [{"role": "user", "content": job["prompt"]}]
+    result = await api.achat_completions(
+        messages,
+        model=job.get("model"),
+        temperature=job.get("temperature"),
+        use_web_search=bool(job.get("use_web_search")),
+    )
+    artifacts.mkdir(parents=True, exist_ok=True)
+    (artifacts / "response.md").write_text(result["content"] or "", encoding="utf-8")
+    return {"success": True, "content": result["content"], "cache": result["cache"], "artifacts": [str(artifacts / "response.md")]}
+
+
+async def _run_image(job: dict, artifacts: Path, base_dir: Path) -> dict:
+    context = [_read_image(p, base_dir) for p in job.get("images") or []]
+    result = await api.agenerate_image(
+        job["prompt"],
+        model=job.get("model", "gemini-2.5-flash-image-preview"),
+        aspect_ratio=job.get("aspect_ratio", "1:1"),
+        n=job.get("n", 1),
+        image_context=context or None,
+    )
+    if not result.get("success"):
+        return result
+    artifacts.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, img in enumerate(result["images"], 1):
+        p = artifacts / f"image_{i}.png"
+        p.write_bytes(img["image_data"])
+        paths.append(str(p))
+    return {"success": True, "count": result["count"], "requested": result["requested"], "errors": result["errors"], "artifacts": paths}
+
+
+async def _run_video(job: dict, artifacts: Path, base_dir: Path) -> dict:
+    artifacts.mkdir(parents=True, exist_ok=True)
+    result = await api.agenerate_video(
+        job["prompt"],
+        model=job.get("model", "veo-3.0-generate-001"),
+        aspect_ratio=job.get("aspect_ratio", "16:9"),
+        duration=job.get("duration", 8),
+        negative_prompt=job.get("negative_prompt", "blurry, low quality"),
+        reference_images=[_read_image(p, base_dir) for p in job.get("reference_images") or []] or None,
+        first_frame_image_data=_read_image(job.get("first_frame"), base_dir),
+        last_frame_image_data=_read_image(job.get("last_frame"), base_dir),
+        # a re-run after a crash picks up the job it already started instead of paying again
+        meta={"batchJobId": job["id"], "inputHash": cache_key("batch.video", job)},
+        output_path=str(artifacts / "video.mp4"),
+        resume=True,
+    )
+    if not result.get("success"):
+        return result
+    return {"success": True, "video_id": result["video_id"], "job_id": result.get("job_id"), "resumed": result["resumed"],
+            "artifacts": [result["video_path"]]}
+
+
+async def _run_tts(job: dict, artifacts: Path, base_dir: Path) -> dict:
+    kwargs = {k: job[k] for k in ("model", "voice") if k in job}
+    # a name of its own per job: TTS jobs run concurrently
+    result = await api.atext_to_speech(job["text"], filename=f"batch_{job['id']}", **kwargs)
+    if not result.get("success"):
+        return result
+    artifacts.mkdir(parents=True, exist_ok=True)
+    dest = artifacts / f"audio{os.path.splitext(result['path'])[1]}"
+    shutil.copyfile(result["path"], dest)
+    return {"success": True, "bytes": result["bytes"], "chunks": result.get("chunks"), "cache": result.get("cache"), "artifacts": [str(dest)]}
+
+
+RUNNERS = {"chat": _run_chat, "image": _run_image, "video": _run_video, "tts": _run_tts}
+
+
+# ---------- Runner ----------
+async def arun_batch(jobs: list, out_dir, base_dir=".", limits: dict | None = None) -> dict:
+    """Run jobs not yet completed in out_dir; returns {"done", "failed", "skipped", "results_path"}."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results_path = out_dir / "results.jsonl"
+    base_dir = Path(base_dir)
+    limits = concurrency_limits(limits)
+    slots = {kind: asyncio.Semaphore(max(1, n)) for kind, n in limits.items()}
+
+    already = completed_ids(results_path)
+    pending = [j for j in jobs if j["id"] not in already]
+    counts = {"done": 0, "failed": 0, "skipped": len(jobs) - len(pending)}
+    batch_start = time.time()
+
+    def _record(entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with open(results_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())  # a completed job must survive a crash
+
+    async def _one(job: dict):
+        async with slots[job["kind"]]:
+            start = time.time()
+            try:
+                result = await RUNNERS[job["kind"]](job, out_dir / "artifacts" / job["id"], base_dir)
+            except Exception as e:
+                result = {"success": False, "error": f"{e.__class__.__name__}: {e}"}
+            status = "done" if result.get("success") else "failed"
+            counts[status] += 1
+            entry = {
+                "id": job["id"],
+                "kind": job["kind"],
+                "status": status,
+                "elapsed_ms": int((time.time() - start) * 1000),
+                "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "result": {k: v for k, v in result.items() if k != "success"},
+            }
+            _record(entry)
+            log_json({"type": "batch.job", "outDir": str(out_dir), "job": job, **entry})
+            print(f"[{status}] {job['kind']} {job['id']} ({entry['elapsed_ms']} ms)", flush=True)
+
+    await asyncio.gather(*(_one(j) for j in pending))
+
+    summary = {**counts, "total": len(jobs), "elapsed_ms": int((time.time() - batch_start) * 1000), "results_path": str(results_path)}
+    log_json({"type": "batch.summary", "outDir": str(out_dir), "limits": limits, **summary})
+    return summary
+
+
+def _parse_limits(spec: str) -> dict:
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, n = part.partition("=")
+        if kind not in KINDS or not n.isdigit():
+            raise argparse.ArgumentTypeError(f"bad concurrency '{part}', expected e.g. chat=8,video=2")
+        limits[kind] = int(n)
+    return limits
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.batch", description="Run chat/image/video/TTS jobs from a JSONL file")
+    parser.add_argument("jobs", help="JSONL file, one job per line")
+    parser.add_argument("--out", help="output directory (default batch_output/<jobs file name>)")
+    parser.add_argument("--concurrency", type=_parse_limits, default={}, help="per-kind limits, e.g. chat=8,video=2")
+    args = parser.parse_args(argv)
+
+    jobs_path = Path(args.jobs)
+    out_dir = Path(args.out) if args.out else Path("batch_output") / jobs_path.stem
+    try:
+        jobs = load_jobs(jobs_path)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    summary = api._run_sync(arun_batch(jobs, out_dir, base_dir=jobs_path.parent, limits=args.concurrency))
+    print(f"\n✅ {summary['done']} done, ❌ {summary['failed']} failed, ⏭  {summary['skipped']} skipped "
+          f"in {summary['elapsed_ms'] / 1000:.1f}s — results: {summary['results_path']}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
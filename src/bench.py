@@ -0,0 +1,365 @@
+# src/bench.py
+"""
+Benchmarks for the local hot paths.
+
+    python -m src.bench                 # full sizes (10k-message conversation, 5k-conversation
+                                        # index, 4K image, 200 MB video)
+    python -m src.bench --quick         # smaller sizes for a fast check
+    python -m src.bench --only log_json,image_obj
+    python -m src.bench --compare bench_results/<older>.json
+
+All state lives in a temporary THUCCHIEN_DATA_DIR / THUCCHIEN_LOGS_DIR, never in data/,
+so run it as its own process.
+Results are written as JSON to bench_results/<UTC-stamp>-<commit>.json (one entry per
+case: timings in ms plus the sizes used) so runs can be compared between commits.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "bench_results"
+
+FULL = {
+    "conv_messages": 10_000,
+    "index_conversations": 5_000,
+    "image_side": (3840, 2160),
+    "video_mb": 200,
+    "repeat": 20,
+}
+QUICK = {
+    "conv_messages": 1_000,
+    "index_conversations": 500,
+    "image_side": (1920, 1080),
+    "video_mb": 20,
+    "repeat": 5,
+}
+
+WORDS = "xin chào hôm nay trời đẹp quá chúng ta cùng nhau làm video về ngày quốc khánh nhé".split()
+
+
+def _text(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _stats(samples: list, **extra) -> dict:
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "min_ms": round(ms[0], 3),
+        "max_ms": round(ms[-1], 3),
+        **extra,
+    }
+
+
+def _time(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# ---------- Fixtures ----------
+def _make_conversation(n_messages: int, seed: int = 1) -> dict:
+    from . import conversations
+
+    rnd = random.Random(seed)
+    conv = conversations.create_conversation("bench conversation")
+    now = int(time.time() * 1000)
+    conv["messages"] = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": _text(rnd, 20 if i % 2 == 0 else 120),
+            "at": now - (n_messages - i) * 1000,
+            "type": "text",
+        }
+        for i in range(n_messages)
+    ]
+    conversations.save_conversation(conv)
+    conversations.flush_conversations()
+    return conv
+
+
+def _fill_index(n_conversations: int):
+    """Write an index with n entries directly (creating 5k conversation files is not the point)."""
+    from . import conversations
+    from .paths import CONV_INDEX
+
+    now = int(time.time() * 1000)
+    if conversations.CONV_STORE == "sqlite":
+        from .conversations_sqlite import insert_conversation
+
+        existing = len(conversations.list_conversations())
+        for i in range(n_conversations - existing):
+            insert_conversation(
+                {"id": f"bench-{i:05d}", "name": f"Conversation {i}", "createdAt": now - i * 60_000, "updatedAt": now - i * 1000, "messages": []}
+            )
+        return
+    idx = json.loads(Path(CONV_INDEX).read_text(encoding="utf-8"))
+    idx["conversations"].extend(
+        {"id": f"bench-{i:05d}", "name": f"Conversation {i}", "createdAt": now - i * 60_000, "updatedAt": now - i * 1000}
+        for i in range(n_conversations - len(idx["conversations"]))
+    )
+    Path(CONV_INDEX).write_text(json.dumps(idx, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def _make_image(size: tuple) -> bytes:
+    """Photo-like PNG (gradient plus noise) so compression ratios are realistic."""
+    from PIL import Image
+
+    w, h = size
+    gradient = Image.linear_gradient("L").resize((w, h))
+    noise = Image.effect_noise((w, h), 40)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    out = io.BytesIO()
+    image.save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+# ---------- Cases ----------
+def bench_append_message(cfg: dict) -> dict:
+    from . import conversations
+
+    conv = _make_conversation(cfg["conv_messages"])
+    _fill_index(cfg["index_conversations"])
+    # flushed every time: the write-behind delay would otherwise hide the write itself
+    def _append():
+        conversations.append_message(conv, "user", "benchmark message " * 10)
+        conversations.flush_conversations()
+
+    samples = _time(_append, cfg["repeat"])
+    return _stats(samples, messages=cfg["conv_messages"], index_conversations=cfg["index_conversations"])
+
+
+def bench_save_conversation(cfg: dict) -> dict:
+    from . import conversations
+    from .paths import CONV_DIR
+
+    conv = _make_conversation(cfg["conv_messages"], seed=2)
+    _fill_index(cfg["index_conversations"])
+    def _save():
+        conversations.save_conversation(conv)
+        conversations.flush_conversations()
+
+    samples = _time(_save, cfg["repeat"])
+    if conversations.CONV_STORE == "sqlite":
+        from .conversations_sqlite import DB_PATH
+
+        size = DB_PATH.stat().st_size
+    else:
+        size = (CONV_DIR / f"{conv['id']}.jsonl").stat().st_size
+    return _stats(samples, messages=cfg["conv_messages"], file_bytes=size)
+
+
+def bench_list_conversations(cfg: dict) -> dict:
+    from . import conversations
+
+    _fill_index(cfg["index_conversations"])
+    samples = _time(conversations.list_conversations, cfg["repeat"])
+    return _stats(samples, index_conversations=cfg["index_conversations"])
+
+
+def bench_log_json(cfg: dict) -> dict:
+    from .logger import log_json
+
+    rnd = random.Random(3)
+    event = {
+        "type": "api.call",
+        "api": "/chat/completions",
+        "conversationId": "bench",
+        "request": {"model": "gemini-2.5-flash", "messages": [{"role": "user", "content": _text(rnd, 60)} for _ in range(40)]},
+        "response": {"choices": [{"message": {"role": "assistant", "content": _text(rnd, 400)}}]},
+        "latency_ms": 1234,
+    }
+    samples = _time(lambda: log_json(event), cfg["repeat"] * 10)
+    return _stats(samples, event_bytes=len(json.dumps(event, ensure_ascii=False).encode("utf-8")))
+
+
+def bench_image_obj(cfg: dict) -> dict:
+    from . import api
+
+    data = _make_image(cfg["image_side"])
+
+    def cold():
+        api.encoded_image_cache._items.clear()
+        api.encoded_image_cache.total = 0
+        api._image_obj(data)
+
+    cold_samples = _time(cold, cfg["repeat"])
+    warm_samples = _time(lambda: api._image_obj(data), cfg["repeat"])
+    mb = len(data) / (1024 * 1024)
+    cold_stats = _stats(cold_samples)
+    return {
+        **cold_stats,
+        "image_bytes": len(data),
+        "image_size": list(cfg["image_side"]),
+        "mb_per_s": round(mb / (cold_stats["median_ms"] / 1000), 1),
+        "cached": _stats(warm_samples),
+    }
+
+
+def bench_video_download(cfg: dict) -> dict:
+    from . import api
+    from .fake_gateway import start_fake_gateway
+
+    size_kb = cfg["video_mb"] * 1024
+    server = start_fake_gateway(config={"latency_ms": 0, "error_rate": 0, "video_kb": size_kb})
+    saved = (api.API_BASE, api.API_KEY, api.GEMINI_API_KEY)
+    # offline: the fake gateway only checks the key when FAKE_GATEWAY_API_KEY is set, and
+    # the per-loop client setup needs THUCCHIEN_API_KEY even for plain downloads
+    key = server.config["api_key"] or "bench-key"
+    api.API_BASE, api.API_KEY, api.GEMINI_API_KEY = server.base_url, key, key
+    dest = Path(tempfile.gettempdir()) / f"bench_video_{os.getpid()}.mp4"
+    try:
+        samples = _time(lambda: api.download_video_to_file("benchvideo", str(dest)), max(2, cfg["repeat"] // 5))
+    finally:
+        api.API_BASE, api.API_KEY, api.GEMINI_API_KEY = saved
+        server.shutdown()
+        server.server_close()
+        dest.unlink(missing_ok=True)
+    stats = _stats(samples, video_bytes=size_kb * 1024)
+    stats["mb_per_s"] = round(cfg["video_mb"] / (stats["median_ms"] / 1000), 1)
+    return stats
+
+
+def bench_render_history(cfg: dict) -> dict:
+    import tkinter as tk
+    from tkinter.scrolledtext import ScrolledText
+
+    from .gui import ChatGUI
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return {"skipped": f"Tk unavailable: {e}"}
+    root.withdraw()
+
+    class _HeadlessHistory:
+        # Reuse ChatGUI's rendering code without building the whole window
+        render_history = ChatGUI.render_history
+        _display_image_in_chat = ChatGUI._display_image_in_chat
+
+    view = _HeadlessHistory()
+    view.history = ScrolledText(root)
+    view.current_conv = _make_conversation(cfg["conv_messages"], seed=4)
+
+    def render():
+        view.render_history()
+        root.update_idletasks()
+
+    try:
+        samples = _time(render, max(3, cfg["repeat"] // 4))
+    finally:
+        root.destroy()
+    return _stats(samples, messages=cfg["conv_messages"])
+
+
+CASES = {
+    "append_message": bench_append_message,
+    "save_conversation": bench_save_conversation,
+    "list_conversations": bench_list_conversations,
+    "log_json": bench_log_json,
+    "image_obj": bench_image_obj,
+    "video_download": bench_video_download,
+    "render_history": bench_render_history,
+}
+
+
+# ---------- Runner ----------
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(names: list, cfg: dict) -> dict:
+    # src modules read the state dirs at import, so they are set before any case imports them
+    workdir = Path(tempfile.mkdtemp(prefix="thucchien_bench_"))
+    os.environ["THUCCHIEN_DATA_DIR"] = str(workdir / "data")
+    os.environ["THUCCHIEN_LOGS_DIR"] = str(workdir / "logs")
+    results = {}
+    try:
+        for name in names:
+            print(f"- {name} ...", flush=True)
+            try:
+                results[name] = CASES[name](cfg)
+            except Exception as e:
+                results[name] = {"error": f"{e.__class__.__name__}: {e}"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(old: dict, new: dict):
+    print(f"\n{'case':<22}{'old ms':>12}{'new ms':>12}{'change':>10}")
+    for name, res in new["results"].items():
+        before = old.get("results", {}).get(name, {})
+        if "median_ms" not in res or "median_ms" not in before:
+            continue
+        change = (res["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0.0
+        print(f"{name:<22}{before['median_ms']:>12.2f}{res['median_ms']:>12.2f}{change:>+9.1f}%")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.bench", description="Benchmarks for local hot paths")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast run")
+    parser.add_argument("--only", default="", help=f"comma-separated cases: {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, help="override the number of repetitions")
+    parser.add_argument("--out", help="result file (default bench_results/<stamp>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.only.split(",") if n.strip()] or list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    cfg = dict(QUICK if args.quick else FULL)
+    if args.repeat:
+        cfg["repeat"] = args.repeat
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {**cfg, "image_side": list(cfg["image_side"])},
+        "results": run(names, cfg),
+    }
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{commit or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"\n{'case':<22}{'median ms':>12}{'p95 ms':>12}")
+    for name, res in report["results"].items():
+        if "median_ms" in res:
+            print(f"{name:<22}{res['median_ms']:>12.2f}{res['p95_ms']:>12.2f}")
+        else:
+            print(f"{name:<22}  {res.get('skipped') or res.get('error')}")
+    print(f"\nResults: {out}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
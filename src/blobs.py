@@ -0,0 +1,230 @@
+# src/blobs.py
+"""
+Content-addressed media store.
+
+    python -m src.blobs              # store statistics
+    python -m src.blobs --migrate    # move existing images/videos into the store
+
+Every image and video is stored once under data/blobs/<h[:2]>/<h[2:4]>/<hash><ext>, keyed by
+its content hash (blake2b, the same hash as cache.content_hash). Writing bytes that are already
+stored is skipped. Conversation messages refer to blobs by "blob" (hash) and keep an
+"image_path" pointing at the blob file for readers that only know paths.
+
+The user-facing output folders (generated_images/, generated_videos/) get hard links to the
+blobs, so they cost no extra space. Where hard links are not possible, or with
+BLOB_LINK_OUTPUTS=0, they get a copy instead. The app replaces output files by rename and
+never writes into a blob, but an editor that overwrites a linked output file in place
+changes the blob as well; set BLOB_LINK_OUTPUTS=0 if that matters.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import threading
+from pathlib import Path
+
+from .cache import content_hash, file_hash
+from .paths import DATA_DIR, CONV_DIR, ROOT
+
+BLOB_DIR = DATA_DIR / "blobs"
+BLOB_LINK_OUTPUTS = os.getenv("BLOB_LINK_OUTPUTS", "1") != "0"
+OUTPUT_DIRS = ("generated_images", "generated_videos")
+
+
+def blob_path(digest: str, suffix: str = "") -> Path:
+    return BLOB_DIR / digest[:2] / digest[2:4] / f"{digest}{suffix.lower()}"
+
+
+def relative(path: Path) -> str:
+    """Path as stored in messages: relative to the project root when possible."""
+    try:
+        return str(Path(path).relative_to(ROOT))
+    except ValueError:
+        return str(path)
+
+
+def _tmp_for(path: Path) -> Path:
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def put_bytes(data: bytes, suffix: str = ".png") -> tuple:
+    """Store data unless it is already stored; returns (hash, blob path)."""
+    digest = content_hash(data)
+    p = blob_path(digest, suffix)
+    if not p.exists():
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp_for(p)
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
+    return digest, p
+
+
+def put_file(path, suffix: str | None = None, move: bool = False) -> tuple:
+    """
+    Store an existing file; returns (hash, blob path). With move=True the file is taken
+    over (hard-linked, or copied when linking fails) and removed from its old place.
+    """
+    path = Path(path)
+    digest = file_hash(path)
+    p = blob_path(digest, path.suffix if suffix is None else suffix)
+    if not p.exists():
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp_for(p)
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, p)
+    if move:
+        path.unlink()
+    return digest, p
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def link_output(blob: Path, dest) -> str:
+    """Make dest a hard link to blob (or a copy); an existing dest is replaced. Returns dest."""
+    dest = Path(dest)
+    if _same_file(blob, dest):
+        return str(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_for(dest)
+    try:
+        if not BLOB_LINK_OUTPUTS:
+            raise OSError("hard links disabled")
+        os.link(blob, tmp)
+    except OSError:
+        shutil.copyfile(blob, tmp)
+    os.replace(tmp, dest)
+    return str(dest)
+
+
+def adopt_output(path) -> tuple:
+    """Store an output file and turn it into a link to its blob; returns (hash, blob path)."""
+    digest, p = put_file(path)
+    link_output(p, path)
+    return digest, p
+
+
+# ---------- Migration ----------
+def _usage(dirs) -> int:
+    """Bytes used by the files under dirs, counting hard-linked files once."""
+    seen, total = set(), 0
+    for d in dirs:
+        for p in Path(d).rglob("*"):
+            if not p.is_file():
+                continue
+            st = p.stat()
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_size
+    return total
+
+
+def _migrate_entry(entry: dict, moved: dict) -> bool:
+    """Point one message / image entry at its blob; returns True if it changed."""
+    if entry.get("blob") or not entry.get("image_path"):
+        return False
+    src = Path(entry["image_path"])
+    if not src.is_absolute():
+        src = ROOT / src
+    src = src.resolve()
+    if src not in moved:
+        if not src.is_file():
+            return False
+        # files under data/conversations/<id>/images only belong to the conversation: move them
+        moved[src] = put_file(src, move=CONV_DIR.resolve() in src.parents)
+    entry["blob"], p = moved[src]
+    entry["image_path"] = relative(p)
+    return True
+
+
+def migrate() -> dict:
+    """
+    Move conversation images into the store (messages are rewritten to point at the
+    blobs) and replace files in the output folders by links to blobs.
+    """
+    from . import conversations
+
+    dirs = [CONV_DIR, BLOB_DIR] + [Path(d) for d in OUTPUT_DIRS]
+    before = _usage(dirs)
+    stats = {"conversations": 0, "images": 0, "outputs": 0, "errors": []}
+    moved = {}  # resolved old path -> (hash, blob path); group messages repeat their first image
+
+    for item in conversations.list_conversations():
+        try:
+            conv = conversations.load_conversation(item["id"])
+            changed = 0
+            for m in conv["messages"]:
+                if m.get("type") != "image":
+                    continue
+                changed += _migrate_entry(m, moved)
+                for img in m.get("images") or []:
+                    changed += _migrate_entry(img, moved)
+            if changed:
+                conversations.rewrite_conversation(conv)
+                stats["conversations"] += 1
+                stats["images"] += changed
+        except Exception as e:
+            stats["errors"].append(f"{item['id']}: {e.__class__.__name__}: {e}")
+
+    for d in OUTPUT_DIRS:
+        for p in sorted(Path(d).rglob("*")) if Path(d).is_dir() else []:
+            if not p.is_file() or p.suffix in (".part", ".tmp"):
+                continue
+            try:
+                adopt_output(p)
+                stats["outputs"] += 1
+            except OSError as e:
+                stats["errors"].append(f"{p}: {e}")
+
+    # image folders of conversations that are now empty
+    for images_dir in CONV_DIR.glob("*/images"):
+        try:
+            images_dir.rmdir()
+            images_dir.parent.rmdir()
+        except OSError:
+            pass
+
+    after = _usage(dirs)
+    stats.update(before_bytes=before, after_bytes=after, reclaimed_bytes=before - after)
+    return stats
+
+
+def store_stats() -> dict:
+    files = [p for p in BLOB_DIR.rglob("*") if p.is_file() and p.suffix != ".tmp"] if BLOB_DIR.exists() else []
+    return {"blobs": len(files), "bytes": sum(p.stat().st_size for p in files)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.blobs", description="Content-addressed media store")
+    parser.add_argument("--migrate", action="store_true", help="move existing images/videos into the store")
+    args = parser.parse_args(argv)
+
+    if args.migrate:
+        from .logger import log_json
+
+        start = time.time()
+        stats = migrate()
+        log_json({"type": "blobs.migrate", **stats, "elapsed_ms": int((time.time() - start) * 1000)})
+        print(f"✅ {stats['images']} image reference(s) in {stats['conversations']} conversation(s), "
+              f"{stats['outputs']} output file(s) moved into {BLOB_DIR}")
+        print(f"   {stats['before_bytes'] / 1e6:.1f} MB -> {stats['after_bytes'] / 1e6:.1f} MB, "
+              f"reclaimed {stats['reclaimed_bytes'] / 1e6:.1f} MB")
+        for e in stats["errors"]:
+            print(f"❌ {e}")
+        return 0 if not stats["errors"] else 1
+
+    s = store_stats()
+    print(f"{BLOB_DIR}: {s['blobs']} blob(s), {s['bytes'] / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# src/cache.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .logger import _to_jsonable, _safe_default
+
+
+def cache_key(*parts) -> str:
+    """
+    Canonical sha256 over JSON-serializable parts (dict keys sorted, no whitespace),
+    so logically equal requests always map to the same key.
+    """
+    blob = json.dumps(_to_jsonable(parts), sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=_safe_default)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class MemoryLRU:
+    """Thread-safe in-memory LRU bounded by item count."""
+
+    def __init__(self, max_items: int = 256):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class SizedLRU:
+    """Thread-safe in-memory LRU bounded by the total size of its values (caller-supplied sizes)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._items = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size: int):
+        if size > self.max_bytes:
+            return  # never cache something that would evict everything else
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.total -= old[1]
+            self._items[key] = (value, size)
+            self.total += size
+            while self.total > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.total -= evicted
+
+
+def content_hash(data: bytes) -> str:
+    """Fast content hash for binary payloads (images, audio)."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def file_hash(path) -> str:
+    """content_hash of a file, read in chunks."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    JSON-file cache (one <key>.json per entry) with a TTL and a total size cap.
+    When the directory grows past max_bytes, the least recently used files are evicted.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, ttl_s: float):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._total = None  # lazily computed directory size
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key):
+        p = self._path(key)
+        try:
+            entry = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("at", 0) > self.ttl_s:
+            self._remove(p)
+            return None
+        try:
+            os.utime(p)  # mark as recently used
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, value):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"at": time.time(), "value": value}, ensure_ascii=False, default=_safe_default)
+        p = self._path(key)
+        tmp = p.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(data, encoding="utf-8")
+        with self._lock:
+            old_size = p.stat().st_size if p.exists() else 0
+            os.replace(tmp, p)
+            self._ensure_total()
+            self._total += p.stat().st_size - old_size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _ensure_total(self):
+        if self._total is None:
+            self._total = sum(f.stat().st_size for f in self.directory.glob("*.json"))
+
+    def _remove(self, p: Path):
+        with self._lock:
+            try:
+                size = p.stat().st_size
+                p.unlink()
+            except OSError:
+                return
+            if self._total is not None:
+                self._total -= size
+
+    def _evict(self):
+        files = sorted(self.directory.glob("*.json"), key=lambda f: f.stat().st_mtime)
+        now = time.time()
+        for f in files:
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                st = f.stat()
+                f.unlink()
+            except OSError:
+                continue
+            self._total -= st.st_size
+        # drop anything already expired while we are here
+        for f in self.directory.glob("*.json"):
+            try:
+                if now - f.stat().st_mtime > self.ttl_s:
+                    size = f.stat().st_size
+                    f.unlink()
+                    self._total -= size
+            except OSError:
+                pass
+
+
+class ResponseCache:
+    """Two-tier cache: in-memory LRU in front of a size-bounded on-disk tier with TTL."""
+
+    def __init__(self, directory: Path, memory_items: int, disk_max_bytes: int, ttl_s: float):
+        self.memory = MemoryLRU(memory_items)
+        self.disk = DiskCache(directory, disk_max_bytes, ttl_s)
+        self.ttl_s = ttl_s
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None or time.time() - entry["at"] > self.ttl_s:
+            entry = self.disk.get(key)
+            if entry is None:
+                return None
+            self.memory.set(key, entry)
+        return entry["value"]
+
+    def set(self, key, value):
+        # Normalize to plain JSON first so both tiers hand back the same shape
+        value = json.loads(json.dumps(_to_jsonable(value), ensure_ascii=False, default=_safe_default))
+        self.memory.set(key, {"at": time.time(), "value": value})
+        self.disk.set(key, value)
+
+
+class BlobCache:
+    """
+    Content-addressed file store: one <key><suffix> file per entry, bounded by total size.
+    Hits refresh the file's mtime, so eviction drops the least recently used files first.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # lazily computed directory size
+
+    def get(self, key: str) -> Path | None:
+        for p in self.directory.glob(f"{key}.*"):
+            if p.suffix == ".tmp":
+                continue
+            try:
+                os.utime(p)  # mark as recently used
+            except OSError:
+                continue
+            return p
+        return None
+
+    def put(self, key: str, src, suffix: str = "", link: bool = False, digest: str | None = None) -> Path:
+        """
+        Store file `src` and return the cached path. By default the entry is a copy, since
+        the source may be overwritten in place later; with link=True it is a hard link
+        (a copy where linking fails), for sources that are only ever replaced by a new file.
+        With digest set, the stored content must have that content_hash, otherwise nothing
+        is stored and ValueError is raised (the file changed since the caller wrote it).
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        p = self.directory / f"{key}{suffix}"
+        tmp = p.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if not link:
+                raise OSError("copy requested")
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        if digest is not None and file_hash(tmp) != digest:
+            tmp.unlink()
+            raise ValueError(f"{src} no longer holds the content to cache under {key}")
+        return self._commit(tmp, p)
+
+    def put_bytes(self, key: str, data: bytes, suffix: str = "") -> Path:
+        """Store data and return the cached path."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        p = self.directory / f"{key}{suffix}"
+        tmp = p.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        return self._commit(tmp, p)
+
+    def _commit(self, tmp: Path, p: Path) -> Path:
+        with self._lock:
+            old_size = p.stat().st_size if p.exists() else 0
+            os.replace(tmp, p)
+            self._ensure_total()
+            self._total += p.stat().st_size - old_size
+            if self._total > self.max_bytes:
+                self._evict()
+        return p
+
+    def _files(self):
+        return [f for f in self.directory.glob("*") if f.is_file() and f.suffix != ".tmp"]
+
+    def _ensure_total(self):
+        if self._total is None:
+            self._total = sum(f.stat().st_size for f in self._files())
+
+    def _evict(self):
+        for f in sorted(self._files(), key=lambda f: f.stat().st_mtime):
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                size = f.stat().st_size
+                f.unlink()
+            except OSError:
+                continue
+            self._total -= size
@@ -0,0 +1,141 @@
+# src/context.py
+"""
+Token-budgeted context windows for long conversations.
+
+build_context keeps the system messages and the most recent turns within a per-model
+token budget (CONTEXT_MAX_TOKENS, CONTEXT_MAX_TOKENS_<MODEL>). Older turns are replaced
+by a rolling summary stored on the conversation ("context_summary"), which is only
+recomputed when more turns age out of the window. When the window overflows, it is
+trimmed down to CONTEXT_LOW_WATER of the budget so the summary is not redone every turn.
+"""
+import os
+import time
+
+from .cache import MemoryLRU, cache_key
+from .conversations import save_conversation
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "16000"))
+CONTEXT_LOW_WATER = float(os.getenv("CONTEXT_LOW_WATER", "0.6"))
+CONTEXT_SUMMARY = os.getenv("CONTEXT_SUMMARY", "1") != "0"
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gemini-2.5-flash")
+CONTEXT_SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", "300"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+_token_counts = MemoryLRU(int(os.getenv("CONTEXT_TOKEN_CACHE_ITEMS", "4096")))
+
+
+def _env_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name).upper()
+
+
+def context_budget(model: str) -> int:
+    """Token budget for a model: CONTEXT_MAX_TOKENS_<MODEL>, else CONTEXT_MAX_TOKENS."""
+    return int(os.getenv(f"CONTEXT_MAX_TOKENS_{_env_name(model)}", CONTEXT_MAX_TOKENS))
+
+
+def count_tokens(message: dict, model: str) -> int:
+    """Tokens for one {role, content} message, cached by model and content."""
+    key = cache_key(model, message["role"], message["content"])
+    n = _token_counts.get(key)
+    if n is None:
+        try:
+            import litellm
+
+            n = litellm.token_counter(model=model, messages=[message])
+        except Exception:
+            # Rough fallback when no tokenizer is available for the model
+            n = len(message["content"] or "") // 3 + 4
+        _token_counts.set(key, n)
+    return n
+
+
+def _as_chat(m: dict) -> dict:
+    return {"role": m["role"], "content": m["content"]}
+
+
+def _summarize(previous: str | None, turns: list) -> str:
+    from .api import chat_completions
+
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    prompt = (
+        f"Summarize the conversation below in at most {CONTEXT_SUMMARY_MAX_WORDS} words, in the "
+        "language it is written in. Keep facts, decisions, names, numbers and open questions "
+        "the assistant will need to continue the conversation. Reply with the summary only.\n\n"
+    )
+    if previous:
+        prompt += f"Existing summary of earlier turns:\n{previous}\n\nNew turns:\n"
+    prompt += transcript
+    result = chat_completions(
+        [{"role": "user", "content": prompt}],
+        model=CONTEXT_SUMMARY_MODEL,
+        temperature=0.0,
+    )
+    return (result["content"] or "").strip()
+
+
+def build_context(conv: dict, model: str, budget: int | None = None) -> dict:
+    """
+    Messages to send for the next turn of `conv`.
+
+    Returns {"messages", "tokens", "budget", "summarized", "dropped"}: "summarized" is
+    how many old turns the summary covers, "dropped" how many were left out without
+    one (summaries disabled or the summary call failed). The newest message is always kept.
+    """
+    budget = budget or context_budget(model)
+    history = conv["messages"]
+    system = [_as_chat(m) for m in history if m["role"] == "system"]
+    turn_idx = [i for i, m in enumerate(history) if m["role"] != "system"]
+    turns = [_as_chat(history[i]) for i in turn_idx]
+
+    summary = conv.get("context_summary") or {}
+    covered = summary.get("turns", 0) if summary.get("content") else 0
+    if covered > len(turns):
+        summary, covered = {}, 0  # history was edited; the summary no longer applies
+
+    def _summary_msg(text):
+        return [{"role": "system", "content": SUMMARY_PREFIX + text}] if text else []
+
+    fixed = sum(count_tokens(m, model) for m in system)
+    costs = [count_tokens(m, model) for m in turns]
+
+    def _fits(start, limit, summary_text):
+        summary_cost = sum(count_tokens(m, model) for m in _summary_msg(summary_text))
+        return fixed + summary_cost + sum(costs[start:]) <= limit
+
+    start = covered
+    summary_text = summary.get("content") if covered else None
+    dropped = 0
+    if not _fits(start, budget, summary_text):
+        # Age out the oldest turns until the rest fits under the low-water mark
+        low_water = int(budget * CONTEXT_LOW_WATER)
+        new_start = start
+        while new_start < len(turns) - 1 and not _fits(new_start, low_water, summary_text):
+            new_start += 1
+
+        aged_out = turns[start:new_start]
+        if CONTEXT_SUMMARY and aged_out:
+            try:
+                summary_text = _summarize(summary_text, aged_out)
+                conv["context_summary"] = {
+                    "content": summary_text,
+                    "turns": new_start,
+                    "model": CONTEXT_SUMMARY_MODEL,
+                    "at": int(time.time() * 1000),
+                }
+                save_conversation(conv)
+            except Exception:
+                # Fall back to plain truncation and retry the summary on the next turn
+                dropped = new_start - start
+        else:
+            dropped = new_start - start
+        start = new_start
+
+    messages = system + _summary_msg(summary_text) + turns[start:]
+    return {
+        "messages": messages,
+        "tokens": sum(count_tokens(m, model) for m in messages),
+        "budget": budget,
+        "summarized": start - dropped if summary_text else 0,
+        "dropped": dropped,
+    }
@@ -1,11 +1,228 @@
+import os
 import json
 import time
 import uuid
+import atexit
+import signal
+import threading
 from pathlib import Path
+from contextlib import contextmanager
+from . import blobs
+from .cache import MemoryLRU
+from .logger import log_json
 from .paths import CONV_DIR, CONV_INDEX, ensure_all_dirs
 
 ensure_all_dirs()
 
+# ---- Storage format ----
+# Each conversation is an append-only log, data/conversations/<id>.jsonl, one record per line:
+#   {"op": "meta", "at": ms, "meta": {...}}        conversation fields except "messages"
+#   {"op": "message", "at": ms, "message": {...}}  one appended message
+# Adding a message appends one line instead of rewriting the whole file. A changed last
+# stored message (only the tail is compared, to keep saves O(new messages)) rewrites the
+# log compacted to a single meta record, and so do logs that pile up more than
+# CONV_COMPACT_META_RECORDS meta records.
+# Legacy <id>.json files are migrated to the log on first load or save.
+#
+# ---- Concurrency ----
+# The GUI thread and background workers write to the same conversation, often through
+# different dict copies (the GUI reloads after every generation). All writes to one
+# conversation go through its lock, and a copy that is missing messages stored through
+# another copy gets them filled in before it is written, so no append is lost. The index
+# is shared with other processes: it is updated under a file lock and replaced atomically.
+CONV_COMPACT_META_RECORDS = int(os.getenv("CONV_COMPACT_META_RECORDS", "50"))
+# "jsonl" (default) or "sqlite": conversations and index in data/conversations.db,
+# see src/conversations_sqlite.py
+CONV_STORE = os.getenv("CONV_STORE", "jsonl").lower()
+
+# ---- In-memory cache and write-behind ----
+# load_conversation returns the cached dict while the stored copy is unchanged (log file
+# mtime/size, or the row's updatedAt for SQLite), so reopening a conversation or reloading
+# it after a reply does not read it again. save_conversation only marks the conversation
+# dirty and the write happens once no save came in for CONV_WRITE_BEHIND_MS (debounced),
+# but at most CONV_WRITE_BEHIND_MAX_MS after the first unwritten save, so a steady stream
+# of saves still reaches the disk. Pending writes are flushed at exit and on SIGTERM/SIGHUP
+# (SIGBREAK on Windows); a signal that arrives while this thread is inside a conversation
+# write is handled once that write is complete.
+CONV_CACHE_SIZE = int(os.getenv("CONV_CACHE_SIZE", "32"))  # conversations; 0 disables
+CONV_WRITE_BEHIND_MS = int(os.getenv("CONV_WRITE_BEHIND_MS", "300"))  # 0 writes immediately
+CONV_WRITE_BEHIND_MAX_MS = int(os.getenv("CONV_WRITE_BEHIND_MAX_MS", "2000"))
+_cache = MemoryLRU(max(1, CONV_CACHE_SIZE))  # conv_id -> (conv, stored stamp)
+_dirty = {}  # conv_id -> conv with unwritten changes
+_dirty_since = {}  # conv_id -> monotonic time of the first unwritten save
+_flush_timers = {}
+# How deep this thread is in conversation code holding locks, and signals held back meanwhile
+_busy = threading.local()
+_deferred_signals = []
+# Keep the full-text search index (src/search.py) up to date on every save
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "1") != "0"
+
+# What is already on disk per conversation id: {"count", "last", "meta", "meta_records"}
+_persisted = {}
+_persisted_lock = threading.Lock()
+# One writer at a time per conversation id
+_conv_locks = {}
+_index_thread_lock = threading.Lock()
+INDEX_LOCK = Path(CONV_INDEX).with_name(Path(CONV_INDEX).name + ".lock")
+
+
+@contextmanager
+def _writing():
+    """
+    Mark this thread as inside conversation code that holds locks. The exit-flush signal
+    handler must not re-enter such a section half-way (plain locks would deadlock, the
+    RLock would let it write a half-updated state), so it waits for the outermost exit.
+    """
+    _busy.depth = getattr(_busy, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _busy.depth -= 1
+        if not _busy.depth and _deferred_signals and threading.current_thread() is threading.main_thread():
+            signum, previous = _deferred_signals.pop(0)
+            _flush_on_signal(signum, None, previous)
+
+
+@contextmanager
+def _conv_lock(conv_id: str):
+    with _writing():
+        with _persisted_lock:
+            lock = _conv_locks.setdefault(conv_id, threading.RLock())
+        with lock:
+            yield
+
+
+@contextmanager
+def _index_lock():
+    """Exclusive lock on the index across threads and processes."""
+    with _writing(), _index_thread_lock, open(INDEX_LOCK, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10 s; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _atomic_write_text(path: Path, text: str):
+    """Write to a temp file next to path, then rename over it: readers never see a torn file."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    for attempt in range(20):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            # Windows refuses to replace a file another reader has open at this moment
+            if os.name != "nt" or attempt == 19:
+                raise
+            time.sleep(0.05)
+
+
+def _sqlite():
+    from . import conversations_sqlite
+    return conversations_sqlite
+
+
+def _log_path(conv_id: str) -> Path:
+    return CONV_DIR / f"{conv_id}.jsonl"
+
+
+def _legacy_path(conv_id: str) -> Path:
+    return CONV_DIR / f"{conv_id}.json"
+
+
+def _meta_of(conv: dict) -> dict:
+    return {k: v for k, v in conv.items() if k not in ("messages", "updatedAt")}
+
+
+def _fingerprint(message: dict) -> str:
+    # a serialized copy, so in-place edits of the live message dict are still detected
+    return json.dumps(message, sort_keys=True, ensure_ascii=False)
+
+
+def _record(op: str, key: str, value, at: int) -> str:
+    return json.dumps({"op": op, "at": at, key: value}, ensure_ascii=False) + "\n"
+
+
+def _remember(conv: dict, meta_records: int):
+    with _persisted_lock:
+        _persisted[conv["id"]] = {
+            "count": len(conv["messages"]),
+            "last": _fingerprint(conv["messages"][-1]) if conv["messages"] else None,
+            "meta": _meta_of(conv),
+            "meta_records": meta_records,
+        }
+
+
+def _write_compacted(conv: dict):
+    """Rewrite the log as one meta record plus the messages (atomic replace)."""
+    at = conv.get("updatedAt") or int(time.time() * 1000)
+    lines = [_record("meta", "meta", _meta_of(conv), at)]
+    lines.extend(_record("message", "message", m, m.get("at", at)) for m in conv["messages"])
+    _atomic_write_text(_log_path(conv["id"]), "".join(lines))
+    _remember(conv, 1)
+
+
+def _append_records(conv_id: str, lines: list):
+    with open(_log_path(conv_id), "a", encoding="utf-8") as f:
+        f.write("".join(lines))
+
+
+def _read_log(conv_id: str) -> dict:
+    conv = {"messages": []}
+    updated = 0
+    meta_records = 0
+    torn = False
+    with open(_log_path(conv_id), encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                torn = True  # torn last line from a crash: everything before it is intact
+                break
+            updated = max(updated, rec.get("at", 0))
+            if rec["op"] == "meta":
+                meta_records += 1
+                conv.update(rec["meta"])
+            elif rec["op"] == "message":
+                conv["messages"].append(rec["message"])
+    conv["updatedAt"] = updated or conv.get("createdAt", 0)
+    # keep the usual key order: id, name, createdAt, updatedAt, ..., messages
+    conv["messages"] = conv.pop("messages")
+    if torn:
+        with _persisted_lock:
+            _persisted.pop(conv_id, None)  # the next save rewrites the log without the torn line
+    else:
+        _remember(conv, meta_records)
+    return conv
+
+
+def _migrate_legacy(conv_id: str) -> dict:
+    legacy = _legacy_path(conv_id)
+    conv = json.loads(legacy.read_text(encoding="utf-8"))
+    _write_compacted(conv)
+    legacy.unlink()
+    return conv
+
+
 def _read_index():
     try:
         return json.loads(Path(CONV_INDEX).read_text(encoding="utf-8"))
@@ -13,9 +230,25 @@ def _read_index():
         return {"conversations": []}
 
 def _write_index(idx):
-    Path(CONV_INDEX).write_text(json.dumps(idx, indent=2, ensure_ascii=False), encoding="utf-8")
+    _atomic_write_text(Path(CONV_INDEX), json.dumps(idx, indent=2, ensure_ascii=False))
+
+def _update_index(conv: dict):
+    with _index_lock():
+        idx = _read_index()
+        for it in idx["conversations"]:
+            if it["id"] == conv["id"]:
+                it["name"] = conv["name"]
+                it["updatedAt"] = conv["updatedAt"]
+                break
+        else:
+            idx["conversations"].append(
+                {"id": conv["id"], "name": conv["name"], "createdAt": conv["createdAt"], "updatedAt": conv["updatedAt"]}
+            )
+        _write_index(idx)
 
 def list_conversations():
+    if CONV_STORE == "sqlite":
+        return _sqlite().list_conversations()
     idx = _read_index()
     idx["conversations"].sort(key=lambda c: c.get("updatedAt", 0), reverse=True)
     return idx["conversations"]
@@ -30,27 +263,216 @@ def create_conversation(name: str | None = None):
         "updatedAt": ts,
         "messages": []  # { role: "user"|"assistant"|"system", content: str, at: ms }
     }
-    (CONV_DIR / f"{conv_id}.json").write_text(json.dumps(conv, indent=2, ensure_ascii=False), encoding="utf-8")
-
-    idx = _read_index()
-    idx["conversations"].append({"id": conv_id, "name": conv["name"], "createdAt": ts, "updatedAt": ts})
-    _write_index(idx)
+    with _conv_lock(conv_id):
+        if CONV_STORE == "sqlite":
+            _sqlite().insert_conversation(conv)
+            _remember(conv, 1)
+        else:
+            _write_compacted(conv)
+            _update_index(conv)
+        _cache_put(conv)
+        _index_for_search(conv)
     return conv
 
+def _load_file(conv_id: str):
+    """Read a conversation from the JSONL log or a legacy .json file, without migrating."""
+    if not _log_path(conv_id).exists() and _legacy_path(conv_id).exists():
+        return json.loads(_legacy_path(conv_id).read_text(encoding="utf-8"))
+    return _read_log(conv_id)
+
+def _stored_stamp(conv_id: str):
+    """Cheap marker that changes whenever the stored conversation changes."""
+    if CONV_STORE == "sqlite":
+        return _sqlite().updated_at(conv_id)
+    try:
+        st = _log_path(conv_id).stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _cache_put(conv: dict):
+    if CONV_CACHE_SIZE > 0:
+        _cache.set(conv["id"], (conv, _stored_stamp(conv["id"])))
+
 def load_conversation(conv_id: str):
-    p = CONV_DIR / f"{conv_id}.json"
-    return json.loads(p.read_text(encoding="utf-8"))
+    with _conv_lock(conv_id):
+        if conv_id in _dirty:
+            return _dirty[conv_id]
+        hit = _cache.get(conv_id) if CONV_CACHE_SIZE > 0 else None
+        if hit is not None and hit[1] is not None and hit[1] == _stored_stamp(conv_id):
+            return hit[0]
+        conv = _load_stored(conv_id)
+        _cache_put(conv)
+        return conv
+
+def _load_stored(conv_id: str):
+    if CONV_STORE == "sqlite":
+        conv = _sqlite().load_conversation(conv_id)
+        _remember(conv, 1)
+        return conv
+    if not _log_path(conv_id).exists() and _legacy_path(conv_id).exists():
+        return _migrate_legacy(conv_id)
+    return _read_log(conv_id)
+
+def _stored_count(conv: dict, state: dict | None) -> int | None:
+    """How many leading messages of conv are already persisted, or None if unknown/changed."""
+    messages = conv["messages"]
+    if state is None or len(messages) < state["count"] or (
+        state["count"] and _fingerprint(messages[state["count"] - 1]) != state["last"]
+    ):
+        return None
+    return state["count"]
+
+def _persist(conv: dict):
+    """Write what changed since the last read/write: appended messages and/or new meta."""
+    conv_id = conv["id"]
+    if not _log_path(conv_id).exists():
+        _write_compacted(conv)
+        if _legacy_path(conv_id).exists():
+            _legacy_path(conv_id).unlink()
+        return
+
+    with _persisted_lock:
+        state = _persisted.get(conv_id)
+    count = _stored_count(conv, state)
+    if count is None:
+        # Unknown on-disk state, or earlier messages were edited/removed
+        _write_compacted(conv)
+        return
+
+    at = conv["updatedAt"]
+    lines = []
+    meta = _meta_of(conv)
+    meta_records = state["meta_records"]
+    if meta != state["meta"]:
+        lines.append(_record("meta", "meta", meta, at))
+        meta_records += 1
+    lines.extend(_record("message", "message", m, m.get("at", at)) for m in conv["messages"][count:])
+    if not lines:
+        return
+    if meta_records > CONV_COMPACT_META_RECORDS:
+        _write_compacted(conv)
+        return
+    _append_records(conv_id, lines)
+    _remember(conv, meta_records)
+
+def _fill_missing(conv: dict):
+    """Add messages that were stored through another copy of this conversation."""
+    with _persisted_lock:
+        state = _persisted.get(conv["id"])
+    have = len(conv["messages"])
+    if state is None or have >= state["count"]:
+        return
+    if CONV_STORE == "sqlite":
+        missing = _sqlite().load_messages(conv["id"], have)
+    else:
+        missing = _load_file(conv["id"])["messages"][have:]
+    conv["messages"].extend(missing)
+
+def _write_now(conv: dict):
+    with _conv_lock(conv["id"]):
+        _fill_missing(conv)
+        if CONV_STORE == "sqlite":
+            with _persisted_lock:
+                state = _persisted.get(conv["id"])
+            _sqlite().save_conversation(conv, _stored_count(conv, state))
+            _remember(conv, 1)
+            _cache_put(conv)
+            return
+        _persist(conv)
+        _cache_put(conv)
+    _update_index(conv)
+
+def _flush(conv_id: str):
+    with _conv_lock(conv_id):
+        timer = _flush_timers.pop(conv_id, None)
+        if timer is not None:
+            timer.cancel()
+        _dirty_since.pop(conv_id, None)
+        conv = _dirty.pop(conv_id, None)
+        if conv is None:
+            return
+        try:
+            _write_now(conv)
+        except Exception:
+            _dirty[conv_id] = conv  # keep it for the next flush (e.g. the one at exit)
+            _dirty_since.setdefault(conv_id, time.monotonic())
+            raise
+
+def flush_conversations():
+    """Write every conversation with pending changes."""
+    for conv_id in list(_dirty):
+        _flush(conv_id)
+
+def _index_for_search(conv: dict):
+    if not SEARCH_INDEX:
+        return
+    try:
+        from . import search
+        search.index_conversation(conv)
+    except Exception as e:
+        # a broken search index must never stop a conversation from being saved
+        log_json({"type": "search.index_error", "conversationId": conv["id"], "error": f"{e.__class__.__name__}: {e}"})
 
 def save_conversation(conv: dict):
-    conv["updatedAt"] = int(time.time() * 1000)
-    (CONV_DIR / f"{conv['id']}.json").write_text(json.dumps(conv, indent=2, ensure_ascii=False), encoding="utf-8")
-    idx = _read_index()
-    for it in idx["conversations"]:
-        if it["id"] == conv["id"]:
-            it["name"] = conv["name"]
-            it["updatedAt"] = conv["updatedAt"]
-            break
-    _write_index(idx)
+    conv_id = conv["id"]
+    with _conv_lock(conv_id):
+        if _dirty.get(conv_id, conv) is not conv:
+            _flush(conv_id)  # another copy has pending changes: write those first
+        _fill_missing(conv)
+        conv["updatedAt"] = int(time.time() * 1000)
+        _index_for_search(conv)
+        if CONV_WRITE_BEHIND_MS <= 0:
+            _write_now(conv)
+            return
+        _dirty[conv_id] = conv
+        # debounce: restart the timer on every save, up to the max delay since the first one
+        since = _dirty_since.setdefault(conv_id, time.monotonic())
+        delay = min(CONV_WRITE_BEHIND_MS / 1000, max(0.0, since + CONV_WRITE_BEHIND_MAX_MS / 1000 - time.monotonic()))
+        timer = _flush_timers.pop(conv_id, None)
+        if timer is not None:
+            timer.cancel()
+        timer = threading.Timer(delay, _flush, args=(conv_id,))
+        timer.daemon = True
+        _flush_timers[conv_id] = timer
+        timer.start()
+
+def _append(conv: dict, message: dict):
+    # fill in first, so the new message lands after anything other copies stored
+    with _conv_lock(conv["id"]):
+        if _dirty.get(conv["id"], conv) is not conv:
+            _flush(conv["id"])
+        _fill_missing(conv)
+        conv["messages"].append(message)
+        save_conversation(conv)
+
+def compact_conversation(conv_id: str):
+    """Rewrite a conversation log as a single meta record plus its messages."""
+    if CONV_STORE == "sqlite":
+        return  # rows are updated in place, nothing to compact
+    with _conv_lock(conv_id):
+        _flush(conv_id)
+        _write_compacted(load_conversation(conv_id))
+
+def rewrite_conversation(conv: dict):
+    """
+    Write conv in full, replacing what is stored. Needed after editing earlier messages,
+    which save_conversation does not look at (it only checks for new ones).
+    """
+    conv_id = conv["id"]
+    with _conv_lock(conv_id):
+        _flush(conv_id)
+        _fill_missing(conv)
+        conv["updatedAt"] = int(time.time() * 1000)
+        if CONV_STORE == "sqlite":
+            _sqlite().insert_conversation(conv)
+            _remember(conv, 1)
+        else:
+            _write_compacted(conv)
+        _cache_put(conv)
+        _index_for_search(conv)
+    if CONV_STORE != "sqlite":
+        _update_index(conv)
 
 def append_message(conv: dict, role: str, content: str, message_type: str = "text"):
     """
@@ -68,8 +490,19 @@ def append_message(conv: dict, role: str, content: str, message_type: str = "tex
         "at": int(time.time() * 1000),
         "type": message_type
     }
-    conv["messages"].append(message)
-    save_conversation(conv)
+    _append(conv, message)
+
+
+def _store_conv_image(image_data: bytes, filename: str | None) -> tuple:
+    """Put the image in the blob store (a no-op if it is already there); returns (path, entry)."""
+    # Generate a filename if not provided
+    if not filename:
+        timestamp = int(time.time())
+        filename = f"image_{timestamp}.png"
+
+    digest, image_path = blobs.put_bytes(image_data, Path(filename).suffix or ".png")
+    # filename stays the display name; the file itself is shared by every copy of the image
+    return image_path, {"image_path": blobs.relative(image_path), "filename": filename, "blob": digest}
 
 
 def append_image_message(conv: dict, role: str, content: str, image_data: bytes, filename: str = None):
@@ -83,22 +516,7 @@ def append_image_message(conv: dict, role: str, content: str, image_data: bytes,
         image_data (bytes): The image data in bytes
         filename (str): Optional filename for the image
     """
-    import os
-    import base64
-    
-    # Create images directory for this conversation if it doesn't exist
-    conv_images_dir = Path(CONV_DIR) / conv["id"] / "images"
-    conv_images_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Generate a filename if not provided
-    if not filename:
-        timestamp = int(time.time())
-        filename = f"image_{timestamp}.png"
-    
-    # Save the image file
-    image_path = conv_images_dir / filename
-    with open(image_path, "wb") as f:
-        f.write(image_data)
+    image_path, entry = _store_conv_image(image_data, filename)
     
     # Create message with image reference
     message = {
@@ -106,11 +524,70 @@ def append_image_message(conv: dict, role: str, content: str, image_data: bytes,
         "content": content,
         "at": int(time.time() * 1000),
         "type": "image",
-        "image_path": str(image_path.relative_to(CONV_DIR.parent.parent)),  # Store relative path
-        "filename": filename
+        **entry,
     }
     
-    conv["messages"].append(message)
-    save_conversation(conv)
+    _append(conv, message)
     
     return str(image_path)
+
+
+def append_image_group_message(conv: dict, role: str, content: str, images: list, filenames: list):
+    """
+    Append several images (e.g. one batch generation) as a single grouped message.
+
+    The message keeps "image_path"/"filename" of the first image for readers that only
+    know single-image messages, and lists every image under "images".
+
+    Args:
+        conv (dict): The conversation object
+        role (str): The role of the message sender (user, assistant)
+        content (str): The text content associated with the images
+        images (list[bytes]): The image data
+        filenames (list[str]): One filename per image
+
+    Returns:
+        list[str]: The saved image paths
+    """
+    stored = [_store_conv_image(data, name) for data, name in zip(images, filenames)]
+    saved = [p for p, _ in stored]
+    entries = [entry for _, entry in stored]
+    message = {
+        "role": role,
+        "content": content,
+        "at": int(time.time() * 1000),
+        "type": "image",
+        **entries[0],
+        "images": entries,
+    }
+    _append(conv, message)
+
+    return [str(p) for p in saved]
+
+
+def _flush_on_signal(signum, frame, previous):
+    if getattr(_busy, "depth", 0):
+        _deferred_signals.append((signum, previous))  # handled when the write in progress ends
+        return
+    flush_conversations()
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+def _install_exit_flush():
+    atexit.register(flush_conversations)
+    if threading.current_thread() is not threading.main_thread():
+        return  # signal handlers can only be set from the main thread
+    for name in ("SIGTERM", "SIGHUP", "SIGBREAK"):
+        sig = getattr(signal, name, None)
+        if sig is None:
+            continue
+        previous = signal.getsignal(sig)
+        signal.signal(sig, lambda signum, frame, previous=previous: _flush_on_signal(signum, frame, previous))
+
+
+if CONV_WRITE_BEHIND_MS > 0:
+    _install_exit_flush()
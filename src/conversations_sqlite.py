@@ -0,0 +1,179 @@
+# src/conversations_sqlite.py
+"""
+SQLite backend for src.conversations (CONV_STORE=sqlite).
+
+    python -m src.conversations_sqlite --import    # one-time import of the JSON/JSONL store
+
+Conversations and their messages live in data/conversations.db (WAL mode). Listing is a
+single indexed query instead of reading and sorting the whole index file, and saving
+touches only the conversation row and the new messages. The database is filled from the
+existing JSON files automatically the first time it is created; --import re-runs that
+import (existing rows are replaced).
+"""
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+from .paths import DATA_DIR
+
+DB_PATH = DATA_DIR / "conversations.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    createdAt INTEGER NOT NULL,
+    updatedAt INTEGER NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updatedAt DESC);
+CREATE INDEX IF NOT EXISTS conversations_name ON conversations(name);
+CREATE TABLE IF NOT EXISTS messages (
+    conv_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (conv_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Fields stored in their own columns; everything else except "messages" goes to "meta"
+_COLUMNS = ("id", "name", "createdAt", "updatedAt")
+
+_local = threading.local()
+_init_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    """One connection per thread (sqlite3 connections must not be shared across threads)."""
+    db = getattr(_local, "db", None)
+    if db is not None:
+        return db
+    with _init_lock:
+        fresh = not DB_PATH.exists()
+        db = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        db.executescript(SCHEMA)
+        _local.db = db
+        if fresh:
+            import_json_store()
+    return db
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _meta_of(conv: dict) -> str:
+    return _dumps({k: v for k, v in conv.items() if k not in _COLUMNS and k != "messages"})
+
+
+def list_conversations() -> list:
+    rows = _connect().execute(
+        "SELECT id, name, createdAt, updatedAt FROM conversations ORDER BY updatedAt DESC"
+    )
+    return [{"id": r[0], "name": r[1], "createdAt": r[2], "updatedAt": r[3]} for r in rows]
+
+
+def insert_conversation(conv: dict):
+    """Insert or replace a whole conversation (row plus all messages)."""
+    db = _connect()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("DELETE FROM messages WHERE conv_id = ?", (conv["id"],))
+        db.execute(
+            "INSERT OR REPLACE INTO conversations (id, name, createdAt, updatedAt, meta) VALUES (?, ?, ?, ?, ?)",
+            (conv["id"], conv["name"], conv["createdAt"], conv.get("updatedAt", conv["createdAt"]), _meta_of(conv)),
+        )
+        db.executemany(
+            "INSERT INTO messages (conv_id, seq, message) VALUES (?, ?, ?)",
+            ((conv["id"], i, _dumps(m)) for i, m in enumerate(conv["messages"])),
+        )
+
+
+def load_conversation(conv_id: str) -> dict:
+    db = _connect()
+    row = db.execute(
+        "SELECT id, name, createdAt, updatedAt, meta FROM conversations WHERE id = ?", (conv_id,)
+    ).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"conversation {conv_id} not found in {DB_PATH}")
+    conv = {"id": row[0], "name": row[1], "createdAt": row[2], "updatedAt": row[3]}
+    conv.update(json.loads(row[4]))
+    conv["messages"] = load_messages(conv_id)
+    return conv
+
+
+def updated_at(conv_id: str) -> int | None:
+    row = _connect().execute("SELECT updatedAt FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+    return row[0] if row else None
+
+
+def load_messages(conv_id: str, start: int = 0) -> list:
+    rows = _connect().execute(
+        "SELECT message FROM messages WHERE conv_id = ? AND seq >= ? ORDER BY seq", (conv_id, start)
+    )
+    return [json.loads(m) for (m,) in rows]
+
+
+def save_conversation(conv: dict, start: int | None):
+    """
+    Persist conv. With start set, messages before index `start` are known to be stored
+    already and only the rest is inserted; with None the whole history is replaced.
+    """
+    if start is None:
+        insert_conversation(conv)
+        return
+    db = _connect()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute(
+            "UPDATE conversations SET name = ?, updatedAt = ?, meta = ? WHERE id = ?",
+            (conv["name"], conv["updatedAt"], _meta_of(conv), conv["id"]),
+        )
+        db.execute("DELETE FROM messages WHERE conv_id = ? AND seq >= ?", (conv["id"], start))
+        db.executemany(
+            "INSERT INTO messages (conv_id, seq, message) VALUES (?, ?, ?)",
+            ((conv["id"], start + i, _dumps(m)) for i, m in enumerate(conv["messages"][start:])),
+        )
+
+
+def import_json_store() -> dict:
+    """Copy every conversation from the JSON/JSONL store into the database."""
+    from . import conversations
+
+    imported, failed = 0, []
+    ids = {c["id"] for c in conversations._read_index()["conversations"]}
+    ids.update(p.stem for p in conversations.CONV_DIR.glob("*.json*") if p.suffix in (".json", ".jsonl"))
+    for conv_id in sorted(ids):
+        try:
+            conv = conversations._load_file(conv_id)
+        except (OSError, ValueError, KeyError) as e:
+            failed.append({"id": conv_id, "error": f"{e.__class__.__name__}: {e}"})
+            continue
+        insert_conversation(conv)
+        imported += 1
+    return {"imported": imported, "failed": failed}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.conversations_sqlite", description="SQLite conversation store")
+    parser.add_argument("--import", dest="do_import", action="store_true", help="import the JSON/JSONL conversations")
+    args = parser.parse_args(argv)
+    if not args.do_import:
+        print(f"{DB_PATH}: {len(list_conversations())} conversation(s)")
+        return 0
+    start = time.time()
+    result = import_json_store()
+    print(f"✅ imported {result['imported']} conversation(s) into {DB_PATH} in {time.time() - start:.1f}s")
+    for f in result["failed"]:
+        print(f"❌ {f['id']}: {f['error']}")
+    return 0 if not result["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+# src/fake_gateway.py
+"""
+Local stand-in for the Thực Chiến gateway, for offline testing and benchmarking.
+
+    python -m src.fake_gateway --port 8808 --latency-ms 300 --error-rate 0.05
+    THUCCHIEN_API_BASE=http://127.0.0.1:8808 python -m src.app
+
+Implements the endpoints src/api.py uses:
+  POST /chat/completions                                  (JSON, SSE streaming, image modality)
+  POST /audio/speech
+  POST /gemini/v1beta/models/<model>:predictLongRunning
+  GET  /gemini/v1beta/<operation>   POST .../<operation>:cancel
+  GET  /gemini/download/v1beta/files/<id>:download        (Range requests supported)
+
+Latency, error rate and payload sizes come from FAKE_GATEWAY_* env vars or the CLI
+flags below. Only the standard library is used.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+DEFAULT_CONFIG = {
+    "latency_ms": float(os.getenv("FAKE_GATEWAY_LATENCY_MS", "50")),  # per request
+    "jitter_ms": float(os.getenv("FAKE_GATEWAY_JITTER_MS", "0")),
+    "stream_chunk_ms": float(os.getenv("FAKE_GATEWAY_STREAM_CHUNK_MS", "20")),  # between SSE chunks
+    "error_rate": float(os.getenv("FAKE_GATEWAY_ERROR_RATE", "0")),  # share of requests that fail
+    "error_status": int(os.getenv("FAKE_GATEWAY_ERROR_STATUS", "429")),
+    "retry_after_s": float(os.getenv("FAKE_GATEWAY_RETRY_AFTER_S", "1")),
+    "reply_words": int(os.getenv("FAKE_GATEWAY_REPLY_WORDS", "60")),
+    "image_side": int(os.getenv("FAKE_GATEWAY_IMAGE_SIDE", "256")),
+    "audio_kb": int(os.getenv("FAKE_GATEWAY_AUDIO_KB", "32")),
+    "video_kb": int(os.getenv("FAKE_GATEWAY_VIDEO_KB", "512")),
+    "video_polls": int(os.getenv("FAKE_GATEWAY_VIDEO_POLLS", "2")),  # polls before an operation is done
+    "api_key": os.getenv("FAKE_GATEWAY_API_KEY", ""),  # require this key when set
+}
+
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def _png(side: int, seed: int) -> bytes:
+    """Noise PNG (RGB, side x side) built with zlib only, so its size scales with side."""
+    rnd = random.Random(seed)
+    rows = b"".join(b"\x00" + rnd.randbytes(side * 3) for _ in range(side))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b"")
+
+
+def _blob(size: int, seed: str) -> bytes:
+    """Deterministic filler bytes for a given id, so Range downloads can be resumed."""
+    block = (seed.encode("utf-8") + b"|") * 64
+    return (block * (size // len(block) + 1))[:size]
+
+
+class FakeGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: dict | None = None, verbose: bool = False):
+        super().__init__(address, _Handler)
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.verbose = verbose
+        self.operations = {}  # operation name -> {"polls", "cancelled", "video_id"}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeGateway
+
+    # ---------- Plumbing ----------
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _json(self, status: int, payload: dict, headers: dict | None = None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", headers)
+
+    def _error(self, status: int, message: str, headers: dict | None = None):
+        self._json(status, {"error": {"message": message, "code": status}}, headers)
+
+    def _delay(self):
+        cfg = self.server.config
+        delay = cfg["latency_ms"] + random.uniform(0, cfg["jitter_ms"])
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _prelude(self) -> bool:
+        """Count, delay, check the key and inject errors; False when a response was already sent."""
+        cfg = self.server.config
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+        self._delay()
+        key = cfg["api_key"]
+        if key:
+            sent = self.headers.get("x-goog-api-key") or self.headers.get("Authorization", "").removeprefix("Bearer ")
+            if sent != key:
+                self._error(401, "Invalid API key")
+                return False
+        if cfg["error_rate"] and random.random() < cfg["error_rate"]:
+            with self.server.lock:
+                self.server.stats["errors_injected"] += 1
+            headers = {"Retry-After": f"{cfg['retry_after_s']:g}"} if cfg["error_status"] in (429, 503) else None
+            self._error(cfg["error_status"], "Injected error from fake gateway", headers)
+            return False
+        return True
+
+    # ---------- Routing ----------
+    def do_HEAD(self):
+        self._send(200, b"", "text/plain")
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if not self._prelude():
+            return
+        if path.startswith("/gemini/download/") and path.endswith(":download"):
+            return self._download(path)
+        if path.startswith("/gemini/v1beta/") and "/operations/" in path:
+            return self._poll(path[len("/gemini/v1beta/"):])
+        self._error(404, f"Not found: {path}")
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self._read_json()
+        if not self._prelude():
+            return
+        if path.endswith("/chat/completions"):
+            return self._chat(body)
+        if path.endswith("/audio/speech"):
+            return self._speech(body)
+        if path.startswith("/gemini/v1beta/models/") and path.endswith(":predictLongRunning"):
+            return self._start_video(path)
+        if path.startswith("/gemini/v1beta/") and path.endswith(":cancel"):
+            return self._cancel(path[len("/gemini/v1beta/"):-len(":cancel")])
+        self._error(404, f"Not found: {path}")
+
+    # ---------- Endpoints ----------
+    def _reply_text(self, body: dict) -> str:
+        last = (body.get("messages") or [{}])[-1].get("content", "")
+        if isinstance(last, list):
+            last = " ".join(p.get("text", "") for p in last if isinstance(p, dict))
+        words = [FILLER[i % len(FILLER)] for i in range(self.server.config["reply_words"])]
+        return f"[fake:{body.get('model')}] {str(last)[:200]} " + " ".join(words)
+
+    def _chat(self, body: dict):
+        model = body.get("model", "fake")
+        created = int(time.time())
+        resp_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if "image" in (body.get("modalities") or []):
+            n = int(body.get("n") or 1)
+            side = self.server.config["image_side"]
+            images = [
+                {"type": "image_url", "image_url": {"url": "data:image/png;base64," + base64.b64encode(_png(side, random.randrange(1 << 30))).decode()}}
+                for _ in range(n)
+            ]
+            message = {"role": "assistant", "content": "", "images": images}
+            return self._json(200, {
+                "id": resp_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+            })
+
+        text = self._reply_text(body)
+        usage = {"prompt_tokens": len(json.dumps(body.get("messages", []))) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not body.get("stream"):
+            return self._json(200, {
+                "id": resp_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            })
+
+        # Server-sent events, one word per chunk, written with chunked transfer encoding
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: str):
+            raw = data.encode("utf-8")
+            self.wfile.write(f"{len(raw):X}\r\n".encode() + raw + b"\r\n")
+            self.wfile.flush()
+
+        pause = self.server.config["stream_chunk_ms"] / 1000
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {"id": resp_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            if pause:
+                time.sleep(pause)
+        final = {"id": resp_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        write(f"data: {json.dumps(final)}\n\n")
+        write("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _speech(self, body: dict):
+        if not body.get("input"):
+            return self._error(400, "input is required")
+        size = self.server.config["audio_kb"] * 1024 + len(body["input"].encode("utf-8")) * 8
+        self._send(200, _blob(size, f"audio:{body.get('voice')}:{body['input']}"), "audio/mpeg")
+
+    def _start_video(self, path: str):
+        model = path[len("/gemini/v1beta/models/"):-len(":predictLongRunning")]
+        name = f"models/{model}/operations/{uuid.uuid4().hex[:16]}"
+        with self.server.lock:
+            self.server.operations[name] = {"polls": 0, "cancelled": False, "video_id": uuid.uuid4().hex[:12]}
+        self._json(200, {"name": name})
+
+    def _poll(self, name: str):
+        with self.server.lock:
+            op = self.server.operations.get(name)
+            if op is not None:
+                op["polls"] += 1
+        if op is None:
+            return self._error(404, f"Unknown operation: {name}")
+        if op["cancelled"]:
+            return self._json(200, {"name": name, "done": True, "error": {"code": 1, "message": "Operation cancelled"}})
+        if op["polls"] < self.server.config["video_polls"]:
+            return self._json(200, {"name": name, "done": False})
+        uri = f"{self.server.base_url}/gemini/download/v1beta/files/{op['video_id']}:download?alt=media"
+        self._json(200, {
+            "name": name,
+            "done": True,
+            "response": {"generateVideoResponse": {"generatedSamples": [{"video": {"uri": uri}}]}},
+        })
+
+    def _cancel(self, name: str):
+        with self.server.lock:
+            op = self.server.operations.get(name)
+            if op is not None:
+                op["cancelled"] = True
+        if op is None:
+            return self._error(404, f"Unknown operation: {name}")
+        self._json(200, {})
+
+    def _download(self, path: str):
+        video_id = path.rsplit("/", 1)[-1][: -len(":download")]
+        data = _blob(self.server.config["video_kb"] * 1024, f"video:{video_id}")
+        rng = self.headers.get("Range", "")
+        if rng.startswith("bytes="):
+            start_s, _, end_s = rng[len("bytes="):].partition("-")
+            start = int(start_s or 0)
+            end = min(int(end_s), len(data) - 1) if end_s else len(data) - 1
+            if start >= len(data):
+                return self._send(416, b"", "video/mp4", {"Content-Range": f"bytes */{len(data)}"})
+            return self._send(206, data[start:end + 1], "video/mp4", {"Content-Range": f"bytes {start}-{end}/{len(data)}", "Accept-Ranges": "bytes"})
+        self._send(200, data, "video/mp4", {"Accept-Ranges": "bytes"})
+
+
+def start_fake_gateway(host: str = "127.0.0.1", port: int = 0, config: dict | None = None, verbose: bool = False) -> FakeGateway:
+    """Start the fake gateway on a background thread (port 0 picks a free port); stop it with .shutdown()."""
+    server = FakeGateway((host, port), config, verbose)
+    threading.Thread(target=server.serve_forever, name="fake-gateway", daemon=True).start()
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.fake_gateway", description="Local fake Thực Chiến gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_GATEWAY_PORT", "8808")))
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    server = FakeGateway((args.host, args.port), config, args.verbose)
+    print(f"Fake gateway listening on {server.base_url}")
+    print(f"Use it with: THUCCHIEN_API_BASE={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,9 +16,24 @@ from .conversations import (
     load_conversation,
     append_message,
     append_image_message,
+    append_image_group_message,
+)
+from .api import (
+    chat_completions,
+    chat_completions_stream,
+    generate_image,
+    save_image,
+    generate_video,
+    warm_up_gateway,
+    resume_video_jobs,
+    preload_sdks,
+    HTTP_PREWARM,
+    STARTUP_PRELOAD,
 )
-from .api import chat_completions, generate_image, save_image, generate_video
 from .logger import log_json
+from .image_context import select_context_images
+from .context import build_context
+from .search import search as search_conversations, catch_up as catch_up_search, is_caught_up as search_caught_up
 
 # ---- Model list / defaults ----
 try:
@@ -41,6 +56,46 @@ except Exception:
         AVAILABLE_MODELS.insert(0, {"name": f"Custom default ({DEFAULT_MODEL})", "value": DEFAULT_MODEL})
 
 
+# ---- Widgets shared by the chat and image windows ----
+IMAGE_COUNT_MAX = 8
+
+
+def insert_image_group(history, images, content):
+    """Insert a grouped image message into a history text widget: thumbnails in one row."""
+    history.insert(tk.END, f"{content}\n")
+    max_width, max_height = 240, 240
+    for img in images:
+        filename = img.get("filename", "image.png")
+        try:
+            image = Image.open(img["image_path"])
+            if image.width > max_width or image.height > max_height:
+                image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+            photo = ImageTk.PhotoImage(image)
+            img_label = tk.Label(history, image=photo, bd=2, relief="solid")
+            img_label.image = photo
+            history.window_create(tk.END, window=img_label, padx=2)
+        except Exception as e:
+            history.insert(tk.END, f"[📷 {filename} - Could not display: {e}]")
+    names = ", ".join(img.get("filename", "image.png") for img in images)
+    history.insert(tk.END, f"\n[Images ({len(images)}): {names}]\n\n")
+
+
+def add_image_count_spinbox(parent) -> tk.IntVar:
+    """Pack a "Count:" label and a 1..IMAGE_COUNT_MAX spinbox into parent; returns its variable."""
+    ttk.Label(parent, text="Count:").pack(side="left")
+    count_var = tk.IntVar(value=1)
+    ttk.Spinbox(parent, from_=1, to=IMAGE_COUNT_MAX, increment=1, textvariable=count_var, width=4).pack(side="left", padx=(6, 12))
+    return count_var
+
+
+def read_image_count(count_var) -> int:
+    """Spinbox value clamped to 1..IMAGE_COUNT_MAX; anything typed that is not a number counts as 1."""
+    try:
+        return min(max(1, int(count_var.get())), IMAGE_COUNT_MAX)
+    except (tk.TclError, ValueError):
+        return 1
+
+
 class ChatGUI(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -50,6 +105,17 @@ class ChatGUI(tk.Tk):
 
         ensure_all_dirs()
 
+        # Open the gateway connection while the window is being built
+        if HTTP_PREWARM:
+            warm_up_gateway()
+        # Resume polling Veo operations left pending by a previous run
+        threading.Thread(target=resume_video_jobs, daemon=True).start()
+        # Import LiteLLM/OpenAI once the window is up, not before it appears
+        if STARTUP_PRELOAD:
+            self.after(200, preload_sdks)
+        # Index conversations changed outside this app so the first search is instant
+        threading.Thread(target=catch_up_search, daemon=True).start()
+
         self.current_conv = None
         self.current_conv_id = None
         self.uploaded_image_path = None
@@ -66,13 +132,19 @@ class ChatGUI(tk.Tk):
             row=0, column=0, columnspan=2, sticky="w", pady=(0, 6)
         )
 
+        # Search box: Enter searches names and messages, an empty query lists everything
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(self.left, textvariable=self.search_var)
+        search_entry.grid(row=1, column=0, columnspan=2, sticky="we", pady=(0, 6))
+        search_entry.bind("<Return>", self.on_search)
+
         self.conv_list = tk.Listbox(self.left, height=28, activestyle="dotbox")
-        self.conv_list.grid(row=1, column=0, columnspan=2, sticky="nswe")
-        self.left.grid_rowconfigure(1, weight=1)
+        self.conv_list.grid(row=2, column=0, columnspan=2, sticky="nswe")
+        self.left.grid_rowconfigure(2, weight=1)
         self.left.grid_columnconfigure(0, weight=1)
 
         btns = ttk.Frame(self.left)
-        btns.grid(row=2, column=0, columnspan=2, sticky="we", pady=8)
+        btns.grid(row=3, column=0, columnspan=2, sticky="we", pady=8)
         ttk.Button(btns, text="New", command=self.on_new_conv).pack(side="left")
         ttk.Button(btns, text="Refresh", command=self.refresh_convs).pack(side="left", padx=6)
         ttk.Button(btns, text="Open", command=self.on_open_conv).pack(side="left")
@@ -116,6 +188,11 @@ class ChatGUI(tk.Tk):
         self.ws_check = ttk.Checkbutton(topbar, text="Use Web Search (context: medium)", variable=self.ws_enabled)
         self.ws_check.pack(side="left", padx=(12, 6))
 
+        # Streaming toggle (render tokens as they arrive)
+        self.stream_enabled = tk.BooleanVar(value=True)
+        self.stream_check = ttk.Checkbutton(topbar, text="Stream", variable=self.stream_enabled)
+        self.stream_check.pack(side="left", padx=(6, 6))
+
         # API base indicator
         api_base = os.getenv("THUCCHIEN_API_BASE", "https://api.thucchien.ai")
         ttk.Label(topbar, text=f"@ {api_base}", foreground="#666").pack(side="right")
@@ -223,6 +300,7 @@ class ChatGUI(tk.Tk):
         selected_api = self.api_var.get()
         if selected_api == "Video Generation":
             self.ws_check.pack_forget()
+            self.stream_check.pack_forget()
             self.temp_spin.pack_forget()
             self.video_params_frame.grid(row=0, column=0, sticky="we", pady=(0, 6))
             self.model_combo.config(values=["veo-3.0-generate-001"])
@@ -230,6 +308,7 @@ class ChatGUI(tk.Tk):
         else:
             self.video_params_frame.grid_forget()
             self.ws_check.pack(side="left", padx=(12, 6))
+            self.stream_check.pack(side="left", padx=(6, 6))
             self.temp_spin.pack(side="left", padx=(6, 12))
             self.model_combo.config(values=[m["value"] for m in AVAILABLE_MODELS])
             self.model_combo.set(DEFAULT_MODEL)
@@ -237,13 +316,32 @@ class ChatGUI(tk.Tk):
     # ---------- Conversations ----------
     def refresh_convs(self):
         self.conv_list.delete(0, tk.END)
-        convs = list_conversations()
+        convs = self.conv_items = list_conversations()
         for c in convs:
             ts = c.get("updatedAt", c.get("createdAt"))
             label = f"{c['name']} — {ts}"
             self.conv_list.insert(tk.END, label)
         self.status.set(f"Loaded {self.conv_list.size()} conversation(s).")
 
+    def on_search(self, _event=None):
+        query = self.search_var.get().strip()
+        if not query:
+            self.refresh_convs()
+            return
+        start = time.perf_counter()
+        # never wait for the startup catch-up here: it runs in its own thread and can take a while
+        results = search_conversations(query, wait=False)
+        self.conv_list.delete(0, tk.END)
+        self.conv_items = []
+        for r in results:
+            if any(it["id"] == r["conv_id"] for it in self.conv_items):
+                continue  # one row per conversation, at its best match
+            self.conv_items.append({"id": r["conv_id"], "name": r["name"]})
+            self.conv_list.insert(tk.END, f"{r['name']} — {r['snippet']}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        partial = "" if search_caught_up() else " Still indexing, results may be incomplete."
+        self.status.set(f"{len(self.conv_items)} conversation(s) match '{query}' ({elapsed_ms:.0f} ms).{partial}")
+
     def on_new_conv(self):
         conv = create_conversation()
         self.status.set(f"Created: {conv['name']}")
@@ -258,8 +356,7 @@ class ChatGUI(tk.Tk):
         if not idx:
             self.status.set("Select a conversation first.")
             return
-        convs = list_conversations()
-        item = convs[idx[0]]
+        item = self.conv_items[idx[0]]
         self.current_conv = load_conversation(item["id"])
         self.current_conv_id = item["id"]
         self.render_history()
@@ -278,7 +375,9 @@ class ChatGUI(tk.Tk):
                 message_type = m.get("type", "text")
                 prefix = "You" if role == "user" else ("Assistant" if role == "assistant" else role)
                 self.history.insert(tk.END, f"{prefix}:\n")
-                if message_type == "image" and "image_path" in m:
+                if message_type == "image" and m.get("images"):
+                    insert_image_group(self.history, m["images"], content)
+                elif message_type == "image" and "image_path" in m:
                     self._display_image_in_chat(m["image_path"], content, m.get("filename", "image.png"))
                 else:
                     self.history.insert(tk.END, f"{content}\n\n")
@@ -338,6 +437,8 @@ class ChatGUI(tk.Tk):
     def _serialize_litellm(self, raw):
         # Fix: ModelResponse is not JSON serializable
         try:
+            if isinstance(raw, dict):
+                return raw
             if hasattr(raw, "model_dump"):
                 return raw.model_dump()
             if hasattr(raw, "dict"):
@@ -351,19 +452,44 @@ class ChatGUI(tk.Tk):
     def _call_chat_api_threadsafe(self):
         start = time.time()
         try:
-            messages = [{"role": m["role"], "content": m["content"]} for m in self.current_conv["messages"]]
             selected_model = self.model_combo.get() or DEFAULT_MODEL
+            context = build_context(self.current_conv, selected_model)
+            messages = context["messages"]
             temperature = float(self.temp_var.get())
             use_web_search = bool(self.ws_enabled.get())
+            use_stream = bool(self.stream_enabled.get())
+
+            ttft_ms = None
+            if use_stream:
+                # Render deltas as they arrive; the assembled reply is saved once at the end.
+                parts = []
+                stream_meta = {}
+                self.after(0, self._begin_stream_message)
+                for delta in chat_completions_stream(
+                    messages=messages,
+                    model=selected_model,
+                    temperature=temperature,
+                    use_web_search=use_web_search,
+                    meta=stream_meta,
+                ):
+                    if ttft_ms is None:
+                        ttft_ms = int((time.time() - start) * 1000)
+                    parts.append(delta)
+                    self.after(0, self._append_stream_chunk, delta)
+                reply = "".join(parts) or "(empty response)"
+                response_log = {"content": reply, "stream": True, "chunks": len(parts)}
+                cache_status = stream_meta.get("cache")
+            else:
+                result = chat_completions(
+                    messages=messages,
+                    model=selected_model,
+                    temperature=temperature,
+                    use_web_search=use_web_search,
+                )
+                reply = result["content"] or "(empty response)"
+                response_log = self._serialize_litellm(result["raw"])
+                cache_status = result.get("cache")
 
-            result = chat_completions(
-                messages=messages,
-                model=selected_model,
-                temperature=temperature,
-                use_web_search=use_web_search,
-            )
-
-            reply = result["content"] or "(empty response)"
             append_message(self.current_conv, "assistant", reply)
 
             api_base = os.getenv("THUCCHIEN_API_BASE", "https://api.thucchien.ai")
@@ -377,10 +503,14 @@ class ChatGUI(tk.Tk):
                     "temperature": temperature,
                     "use_web_search": use_web_search,
                     "web_search_options": {"search_context_size": "medium"} if use_web_search else None,
+                    "stream": use_stream,
                     "messages": messages,
                 },
-                "response": self._serialize_litellm(result["raw"]),
+                "response": response_log,
                 "latency_ms": int((time.time() - start) * 1000),
+                "ttft_ms": ttft_ms,
+                "cache": cache_status,
+                "context": {k: v for k, v in context.items() if k != "messages"},
                 "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
             }
             log_path = log_json(log_payload)
@@ -397,6 +527,20 @@ class ChatGUI(tk.Tk):
             )
             self._on_api_done(False, f"Error: {e}. Logged at: {log_path}")
 
+    # Streaming helpers (always run on the Tk thread via after())
+    def _begin_stream_message(self):
+        self.history.config(state="normal")
+        self.history.insert(tk.END, "Assistant:\n")
+        self.history.config(state="disabled")
+        self.history.see(tk.END)
+        self.status.set("Streaming response...")
+
+    def _append_stream_chunk(self, delta: str):
+        self.history.config(state="normal")
+        self.history.insert(tk.END, delta)
+        self.history.config(state="disabled")
+        self.history.see(tk.END)
+
     def _call_video_api_threadsafe(self):
         start = time.time()
         try:
@@ -421,6 +565,8 @@ class ChatGUI(tk.Tk):
             is_image_mode = bool(first_frame_image_data or last_frame_image_data or reference_images)
             person_generation = "allow_adult" if is_image_mode else "allow_all"
 
+            timestamp = int(time.time())
+            filename = f"generated_video_{timestamp}.mp4"
             result = generate_video(
                 prompt=prompt,
                 model=model,
@@ -431,6 +577,8 @@ class ChatGUI(tk.Tk):
                 reference_images=reference_images if reference_images else None,
                 first_frame_image_data=first_frame_image_data,
                 last_frame_image_data=last_frame_image_data,
+                meta={"conversationId": self.current_conv["id"]},
+                output_path=os.path.join("generated_videos", filename),
             )
 
             # Clear images after call
@@ -445,9 +593,7 @@ class ChatGUI(tk.Tk):
             self.video_negative_prompt_input.delete("1.0", tk.END)
 
             if result["success"]:
-                timestamp = int(time.time())
-                filename = f"generated_video_{timestamp}.mp4"
-                video_path = self._save_video(result["video_data"], filename)
+                video_path = result["video_path"]
 
                 append_message(
                     self.current_conv,
@@ -474,7 +620,12 @@ class ChatGUI(tk.Tk):
                         "reference_images_count": len(reference_images) if reference_images else 0,
                         "person_generation": person_generation,
                     },
-                    "response": {"video_id": result.get("video_id"), "path": video_path, "resolution": result.get("resolution")},
+                    "response": {
+                        "video_id": result.get("video_id"),
+                        "job_id": result.get("job_id"),
+                        "path": video_path,
+                        "resolution": result.get("resolution"),
+                    },
                     "latency_ms": int((time.time() - start) * 1000),
                     "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
                 }
@@ -496,13 +647,6 @@ class ChatGUI(tk.Tk):
             )
             self._on_api_done(False, f"Error: {e}. Logged at: {log_path}")
 
-    def _save_video(self, video_data, filename):
-        os.makedirs("generated_videos", exist_ok=True)
-        filepath = os.path.join("generated_videos", filename)
-        with open(filepath, "wb") as f:
-            f.write(video_data)
-        return filepath
-
     def _on_api_done(self, success: bool, msg: str):
         self.after(0, self._finalize_ui_update, success, msg)
 
@@ -675,6 +819,8 @@ class ImageGeneratorWindow(tk.Toplevel):
         self.ratio_combo["values"] = ["1:1", "16:9", "9:16", "4:3", "3:4"]
         self.ratio_combo.pack(side="left", padx=(6, 12))
 
+        self.count_var = add_image_count_spinbox(topbar)
+
         api_base = os.getenv("THUCCHIEN_API_BASE", "https://api.thucchien.ai")
         ttk.Label(topbar, text=f"@ {api_base}", foreground="#666").pack(side="right")
 
@@ -722,7 +868,7 @@ class ImageGeneratorWindow(tk.Toplevel):
     # Conversations
     def refresh_convs(self):
         self.conv_list.delete(0, tk.END)
-        convs = list_conversations()
+        convs = self.conv_items = list_conversations()
         for c in convs:
             ts = c.get("updatedAt", c.get("createdAt"))
             label = f"{c['name']} — {ts}"
@@ -743,8 +889,7 @@ class ImageGeneratorWindow(tk.Toplevel):
         if not idx:
             self.status.set("Select a conversation first.")
             return
-        convs = list_conversations()
-        item = convs[idx[0]]
+        item = self.conv_items[idx[0]]
         self.current_conv = load_conversation(item["id"])
         self.current_conv_id = item["id"]
         self.render_history()
@@ -766,7 +911,9 @@ class ImageGeneratorWindow(tk.Toplevel):
                 message_type = m.get("type", "text")
                 prefix = "You" if role == "user" else ("Assistant" if role == "assistant" else role)
                 self.history.insert(tk.END, f"{prefix}:\n")
-                if message_type == "image" and "image_path" in m:
+                if message_type == "image" and m.get("images"):
+                    insert_image_group(self.history, m["images"], content)
+                elif message_type == "image" and "image_path" in m:
                     self._display_image_in_chat(m["image_path"], content, m.get("filename", "image.png"))
                 else:
                     self.history.insert(tk.END, f"{content}\n\n")
@@ -817,41 +964,47 @@ class ImageGeneratorWindow(tk.Toplevel):
         start = time.time()
         try:
             prompt = ""
-            image_context = []
-            if self.uploaded_image_data:
-                image_context.append(self.uploaded_image_data)
             for m in reversed(self.current_conv["messages"]):
-                if m.get("type") == "image" and "image_path" in m:
-                    try:
-                        with open(m["image_path"], "rb") as img_file:
-                            img_data = img_file.read()
-                            image_context.append(img_data)
-                    except Exception:
-                        pass
-                elif m["role"] == "user" and not prompt:
+                if m.get("type") != "image" and m["role"] == "user":
                     prompt = m["content"]
+                    break
+            # Most recent images only, downscaled and within the byte budget
+            image_context = select_context_images(
+                self.current_conv["messages"],
+                extra_images=[self.uploaded_image_data] if self.uploaded_image_data else None,
+            )
             if not prompt:
                 prompt = "Generate an image based on the uploaded context"
 
+            n = read_image_count(self.count_var)
             result = generate_image(
                 prompt=prompt,
                 model=self.model_combo.get(),
                 aspect_ratio=self.ratio_var.get(),
+                n=n,
                 image_context=image_context if image_context else None,
             )
 
             if result["success"]:
                 timestamp = int(time.time())
-                filename = f"generated_{timestamp}.png"
-                saved_path = save_image(result["image_data"], filename)
-                image_path = append_image_message(
-                    self.current_conv,
-                    "assistant",
-                    f"Generated image using {self.model_combo.get()} based on: '{prompt}'",
-                    result["image_data"],
-                    filename,
+                images = [img["image_data"] for img in result["images"]]
+                content = f"Generated image using {self.model_combo.get()} based on: '{prompt}'"
+                if len(images) == 1:
+                    filenames = [f"generated_{timestamp}.png"]
+                    saved_paths = [save_image(images[0], filenames[0])]
+                    image_path = append_image_message(self.current_conv, "assistant", content, images[0], filenames[0])
+                else:
+                    # One grouped message for the whole batch
+                    filenames = [f"generated_{timestamp}_{i + 1}.png" for i in range(len(images))]
+                    saved_paths = [save_image(data, name) for data, name in zip(images, filenames)]
+                    content = f"Generated {len(images)} images using {self.model_combo.get()} based on: '{prompt}'"
+                    image_path = append_image_group_message(self.current_conv, "assistant", content, images, filenames)[0]
+                done_msg = (
+                    f"Image generated and saved: {filenames[0]}"
+                    if len(images) == 1
+                    else f"{len(images)}/{n} images generated and saved: {filenames[0]} ..."
                 )
-                self._on_image_done(True, f"Image generated and saved: {filename}", image_path)
+                self._on_image_done(True, done_msg, image_path)
                 self.parent.current_conv = load_conversation(self.current_conv_id)
                 self.parent.render_history()
                 log_payload = {
@@ -862,8 +1015,18 @@ class ImageGeneratorWindow(tk.Toplevel):
                         "prompt": prompt,
                         "model": self.model_combo.get(),
                         "aspect_ratio": self.ratio_var.get(),
+                        "n": n,
+                        "context_images": len(image_context),
+                        "context_bytes": sum(len(b) for b in image_context),
+                    },
+                    "response": {
+                        "filename": filenames[0],
+                        "path": saved_paths[0],
+                        "filenames": filenames,
+                        "paths": saved_paths,
+                        "count": len(images),
+                        "errors": result.get("errors"),
                     },
-                    "response": {"filename": filename, "path": saved_path},
                     "latency_ms": int((time.time() - start) * 1000),
                     "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
                 }
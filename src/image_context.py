@@ -0,0 +1,126 @@
+# src/image_context.py
+"""
+Context-image selection for image generation.
+
+Instead of sending every image in the conversation at full size, pick the most recent
+ones (IMAGE_CONTEXT_MAX_IMAGES) within a byte budget (IMAGE_CONTEXT_MAX_MB), each
+downscaled to IMAGE_CONTEXT_MAX_SIDE and recompressed. Reduced versions are cached on
+disk under data/cache/image_context/ so they are computed once per source image; the
+cache is capped at IMAGE_CONTEXT_CACHE_MB, least recently used entries go first.
+"""
+import io
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from .cache import BlobCache, content_hash, cache_key
+from .paths import ROOT, CACHE_DIR
+
+IMAGE_CONTEXT_MAX_IMAGES = int(os.getenv("IMAGE_CONTEXT_MAX_IMAGES", "4"))
+IMAGE_CONTEXT_MAX_BYTES = int(float(os.getenv("IMAGE_CONTEXT_MAX_MB", "4")) * 1024 * 1024)
+IMAGE_CONTEXT_MAX_SIDE = int(os.getenv("IMAGE_CONTEXT_MAX_SIDE", "1024"))
+IMAGE_CONTEXT_JPEG_QUALITY = int(os.getenv("IMAGE_CONTEXT_JPEG_QUALITY", "85"))
+IMAGE_CONTEXT_CACHE_DIR = CACHE_DIR / "image_context"
+reduced_cache = BlobCache(
+    IMAGE_CONTEXT_CACHE_DIR, max_bytes=int(float(os.getenv("IMAGE_CONTEXT_CACHE_MB", "200")) * 1024 * 1024)
+)
+
+
+def reduce_image(data: bytes, max_side: int = IMAGE_CONTEXT_MAX_SIDE, quality: int = IMAGE_CONTEXT_JPEG_QUALITY) -> bytes:
+    """
+    Downscale so the longest side is at most max_side and recompress.
+    Images with transparency stay PNG, everything else becomes JPEG.
+    Returns the original bytes if that is already smaller.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image.save(out, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+    reduced = out.getvalue()
+    return reduced if len(reduced) < len(data) else data
+
+
+def _cached_reduce(key: str, load) -> bytes:
+    p = reduced_cache.get(key)
+    if p is not None:
+        try:
+            return p.read_bytes()
+        except OSError:
+            pass  # evicted in the meantime
+    reduced = reduce_image(load())
+    try:
+        reduced_cache.put_bytes(key, reduced, ".bin")
+    except OSError:
+        pass  # caching is best effort
+    return reduced
+
+
+def reduced_image_from_path(path) -> bytes:
+    """
+    Reduced version of an image file. The cache key uses path, mtime and size,
+    so a hit never reads the original file.
+    """
+    p = Path(path)
+    if not p.is_absolute():
+        p = ROOT / p
+    st = p.stat()
+    key = cache_key("file", str(p.resolve()), st.st_mtime_ns, st.st_size, IMAGE_CONTEXT_MAX_SIDE, IMAGE_CONTEXT_JPEG_QUALITY)
+    return _cached_reduce(key, p.read_bytes)
+
+
+def reduced_image_from_bytes(data: bytes) -> bytes:
+    key = cache_key("bytes", content_hash(data), IMAGE_CONTEXT_MAX_SIDE, IMAGE_CONTEXT_JPEG_QUALITY)
+    return _cached_reduce(key, lambda: data)
+
+
+def _message_image_paths(m: dict) -> list:
+    if m.get("type") != "image":
+        return []
+    if m.get("images"):
+        return [img["image_path"] for img in reversed(m["images"]) if img.get("image_path")]
+    return [m["image_path"]] if m.get("image_path") else []
+
+
+def select_context_images(
+    messages: list,
+    extra_images: list | None = None,
+    max_images: int = IMAGE_CONTEXT_MAX_IMAGES,
+    max_bytes: int = IMAGE_CONTEXT_MAX_BYTES,
+) -> list:
+    """
+    Newest-first list of reduced context images (bytes) from a conversation.
+
+    extra_images (raw bytes, e.g. a fresh upload) come first. Selection stops at
+    max_images or when the next image would exceed max_bytes; unreadable images are skipped.
+    """
+    selected = []
+    total = 0
+
+    def _take(data: bytes) -> bool:
+        nonlocal total
+        if len(selected) >= max_images or total + len(data) > max_bytes:
+            return False
+        selected.append(data)
+        total += len(data)
+        return True
+
+    for data in extra_images or []:
+        try:
+            if not _take(reduced_image_from_bytes(data)):
+                return selected
+        except Exception:
+            continue
+
+    for m in reversed(messages):
+        for path in _message_image_paths(m):
+            try:
+                data = reduced_image_from_path(path)
+            except Exception:
+                continue
+            if not _take(data):
+                return selected
+    return selected
@@ -75,6 +75,21 @@ def _to_jsonable(obj: Any):
     return obj
 
 
+def _reserve_log_file(stamp: str) -> Path:
+    """
+    Exclusively create logs/<stamp>.json (or <stamp>-1.json, -2, ...) so concurrent
+    events never overwrite each other.
+    """
+    n = 0
+    while True:
+        fp = LOGS_DIR / (f"{stamp}.json" if n == 0 else f"{stamp}-{n}.json")
+        try:
+            with open(fp, "x", encoding="utf-8"):
+                return fp
+        except FileExistsError:
+            n += 1
+
+
 def log_json(event: dict) -> str:
     """
     Write an event dict to logs/<UTC-timestamp>.json in UTF-8.
@@ -85,9 +100,9 @@ def log_json(event: dict) -> str:
     # Ensure folder exists
     LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Timestamp filename (UTC)
+    # Timestamp filename (UTC); events within the same second get a -<n> suffix
     stamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%SZ")
-    fp = LOGS_DIR / f"{stamp}.json"
+    fp = _reserve_log_file(stamp)
 
     # Normalize event recursively first
     normalized = _to_jsonable(event)
@@ -2,10 +2,13 @@ import os
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
-LOGS_DIR = ROOT / "logs"
-DATA_DIR = ROOT / "data"
+# THUCCHIEN_DATA_DIR / THUCCHIEN_LOGS_DIR relocate all state (used by benchmarks and tests)
+LOGS_DIR = Path(os.getenv("THUCCHIEN_LOGS_DIR") or ROOT / "logs")
+DATA_DIR = Path(os.getenv("THUCCHIEN_DATA_DIR") or ROOT / "data")
 CONV_DIR = DATA_DIR / "conversations"
 CONV_INDEX = DATA_DIR / "conversations.index.json"
+CACHE_DIR = DATA_DIR / "cache"
+VIDEO_JOBS_DIR = DATA_DIR / "video_jobs"
 
 def ensure_all_dirs():
     LOGS_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,208 @@
+# src/ratelimit.py
+"""
+Client-side rate limiting and retries for gateway calls.
+
+Every call takes a token from its endpoint bucket (RATE_LIMIT_<ENDPOINT>) and, when
+configured, from a per-model bucket (RATE_LIMIT_MODEL_<MODEL>). Limits are written as
+"<requests per second>/<burst>", e.g. RATE_LIMIT_CHAT=5/10; "0" disables a bucket.
+429/5xx responses and transport errors are retried, honoring Retry-After when the
+gateway sends it and using jittered exponential backoff otherwise. Paid, non-idempotent
+calls (starting a video) are retried on 429/503 only.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from .logger import log_json
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# responses that say the request was turned away before any work started
+REJECTED_STATUSES = {429, 503}
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_S = float(os.getenv("RETRY_BASE_S", "1.0"))
+RETRY_MAX_S = float(os.getenv("RETRY_MAX_S", "60"))
+RATE_LIMIT_LOG_WAIT_S = float(os.getenv("RATE_LIMIT_LOG_WAIT_S", "1.0"))
+
+DEFAULT_LIMITS = {
+    "chat": "10/20",
+    "image": "2/5",
+    "video_start": "0.5/2",
+    "video_poll": "5/10",
+    "download": "5/10",
+    "tts": "2/5",
+}
+
+
+class TokenBucket:
+    """
+    Token bucket shared by threads and event loops: state is guarded by a thread lock,
+    waiting happens with asyncio.sleep outside of it. A caller reserves its token up
+    front, so concurrent callers queue up instead of stampeding.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def _parse_limit(spec: str):
+    spec = (spec or "").strip()
+    if not spec or spec == "0":
+        return None
+    rate, _, burst = spec.partition("/")
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return TokenBucket(rate, float(burst) if burst else max(1.0, rate))
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _env_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name).upper()
+
+
+def get_bucket(kind: str, name: str):
+    """Bucket for ("endpoint", "chat") or ("model", "gemini-2.5-pro"); None when unlimited."""
+    key = (kind, name)
+    with _buckets_lock:
+        if key not in _buckets:
+            if kind == "endpoint":
+                spec = os.getenv(f"RATE_LIMIT_{_env_name(name)}", DEFAULT_LIMITS.get(name, ""))
+            else:
+                spec = os.getenv(f"RATE_LIMIT_MODEL_{_env_name(name)}", os.getenv("RATE_LIMIT_MODEL_DEFAULT", ""))
+            _buckets[key] = _parse_limit(spec)
+        return _buckets[key]
+
+
+async def throttle(endpoint: str, model: str | None = None) -> float:
+    """Wait for the endpoint (and model) buckets; returns the seconds spent waiting."""
+    waited = 0.0
+    for bucket in (get_bucket("endpoint", endpoint), get_bucket("model", model) if model else None):
+        if bucket is not None:
+            waited += await bucket.acquire()
+    return waited
+
+
+def status_of(exc: BaseException):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after_s(exc: BaseException):
+    value = None
+    # httpx/openai errors carry the response; litellm copies upstream headers separately
+    for headers in (
+        getattr(getattr(exc, "response", None), "headers", None),
+        getattr(exc, "litellm_response_headers", None),
+        getattr(exc, "headers", None),
+    ):
+        if headers:
+            value = headers.get("Retry-After") or headers.get("retry-after")
+            if value:
+                break
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "Timeout", "ServiceUnavailableError"):
+        return True
+    return status_of(exc) in RETRY_STATUSES
+
+
+def was_rejected(exc: BaseException) -> bool:
+    """
+    Retry test for non-idempotent calls: only an explicit 429/503 proves the request was
+    not acted on. A timeout or dropped connection may come after the server started work.
+    """
+    return status_of(exc) in REJECTED_STATUSES
+
+
+def backoff_s(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (1-based) retry attempt."""
+    return random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * (2 ** attempt)))
+
+
+async def with_retries(endpoint: str, model, call, max_attempts: int = RETRY_MAX_ATTEMPTS, retry_on=is_retryable):
+    """
+    Run `await call()` under the rate limiter, retrying failures for which retry_on(exc)
+    is true (is_retryable by default; was_rejected for calls that must not run twice).
+    Each retry is logged as an "api.retry" event; long limiter waits as "api.throttle".
+    """
+    attempt = 0
+    total_wait = 0.0
+    while True:
+        waited = await throttle(endpoint, model)
+        total_wait += waited
+        if waited >= RATE_LIMIT_LOG_WAIT_S:
+            log_json(
+                {
+                    "type": "api.throttle",
+                    "endpoint": endpoint,
+                    "model": model,
+                    "wait_ms": int(waited * 1000),
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                }
+            )
+        try:
+            return await call()
+        except Exception as e:
+            attempt += 1
+            if attempt >= max_attempts or not retry_on(e):
+                raise
+            retry_after = _retry_after_s(e)
+            delay = min(RETRY_MAX_S, retry_after) if retry_after is not None else backoff_s(attempt)
+            total_wait += delay
+            log_json(
+                {
+                    "type": "api.retry",
+                    "endpoint": endpoint,
+                    "model": model,
+                    "attempt": attempt,
+                    "status_code": status_of(e),
+                    "error": {"type": e.__class__.__name__, "message": str(e)[:500]},
+                    "retry_after_s": retry_after,
+                    "delay_ms": int(delay * 1000),
+                    "total_wait_ms": int(total_wait * 1000),
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                }
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,236 @@
+# src/search.py
+"""
+Full-text search over conversation names and message content.
+
+    python -m src.search "từ khóa"          # search
+    python -m src.search --rebuild          # drop and rebuild the index
+
+The index is an SQLite FTS5 table in data/search.db. src.conversations feeds it from
+save_conversation/append_message, indexing only the messages added since the last call,
+and the first search indexes whatever has not been seen yet. A hash of the last indexed
+message is kept; if it no longer matches (a message was edited or removed), that
+conversation is indexed again from scratch. Text is folded before
+indexing and querying (lowercase, Vietnamese diacritics removed, đ -> d), so "viet nam",
+"Việt Nam" and "VIỆT NAM" all match each other. The last query word matches as a prefix.
+"""
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from functools import lru_cache
+
+from .cache import content_hash
+from .paths import DATA_DIR
+
+SEARCH_DB = DATA_DIR / "search.db"
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+    folded, content UNINDEXED, conv_id UNINDEXED, seq UNINDEXED, role UNINDEXED, at UNINDEXED,
+    tokenize = 'unicode61', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS indexed (
+    conv_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    updatedAt INTEGER,
+    name_rowid INTEGER,
+    last TEXT
+);
+"""
+
+NAME_SEQ = -1  # seq of the document holding the conversation name
+
+_local = threading.local()
+_caught_up = False
+_catch_up_lock = threading.Lock()  # one catch-up at a time; others wait for it
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(ch: str) -> str:
+    if ch in "đĐ":
+        return "d"
+    base = unicodedata.normalize("NFD", ch)[0].lower()
+    return base if len(base) == 1 else ch
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics (đ -> d), one output char per input char."""
+    return "".join(map(_fold_char, unicodedata.normalize("NFC", text or "")))
+
+
+def _connect() -> sqlite3.Connection:
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = sqlite3.connect(SEARCH_DB, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        if "last" not in {r[1] for r in db.execute("PRAGMA table_info(indexed)")}:
+            db.execute("ALTER TABLE indexed ADD COLUMN last TEXT")  # index built by an older version
+        _local.db = db
+    return db
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content")
+    return content if isinstance(content, str) else ""
+
+
+def _fingerprint(message: dict) -> str:
+    return content_hash(json.dumps(message, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+
+def index_conversation(conv: dict):
+    """Add the name and any messages of conv that are not indexed yet."""
+    db = _connect()
+    conv_id = conv["id"]
+    messages = conv.get("messages", [])
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute("SELECT name, count, name_rowid, last FROM indexed WHERE conv_id = ?", (conv_id,)).fetchone()
+        name, count, name_rowid, last = row if row else (None, 0, None, None)
+        if count > len(messages) or (count and _fingerprint(messages[count - 1]) != last):
+            # history was shortened or edited: index the conversation again from scratch (full scan, rare)
+            db.execute("DELETE FROM docs WHERE conv_id = ?", (conv_id,))
+            name, count, name_rowid = None, 0, None
+        if name != conv["name"]:
+            if name_rowid is not None:
+                db.execute("DELETE FROM docs WHERE rowid = ?", (name_rowid,))
+            name_rowid = db.execute(
+                "INSERT INTO docs (folded, content, conv_id, seq, role, at) VALUES (?, ?, ?, ?, ?, ?)",
+                (fold(conv["name"]), conv["name"], conv_id, NAME_SEQ, None, conv.get("createdAt")),
+            ).lastrowid
+        db.executemany(
+            "INSERT INTO docs (folded, content, conv_id, seq, role, at) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (fold(_message_text(m)), _message_text(m), conv_id, count + i, m.get("role"), m.get("at"))
+                for i, m in enumerate(messages[count:])
+                if _message_text(m)
+            ),
+        )
+        db.execute(
+            "INSERT OR REPLACE INTO indexed (conv_id, name, count, updatedAt, name_rowid, last) VALUES (?, ?, ?, ?, ?, ?)",
+            (conv_id, conv["name"], len(messages), conv.get("updatedAt"), name_rowid,
+             _fingerprint(messages[-1]) if messages else None),
+        )
+
+
+def catch_up() -> int:
+    """
+    Index conversations that changed without going through this process (other processes,
+    SEARCH_INDEX=0, an older version); returns how many were updated. A call made while
+    another thread is catching up waits for that run to finish first.
+    """
+    with _catch_up_lock:
+        return _catch_up()
+
+
+def _catch_up() -> int:
+    global _caught_up
+    from . import conversations
+
+    known = dict(_connect().execute("SELECT conv_id, updatedAt FROM indexed"))
+    done = 0
+    for item in conversations.list_conversations():
+        if item["id"] in known and known[item["id"]] == item.get("updatedAt"):
+            continue
+        try:
+            conv = conversations.load_conversation(item["id"])
+        except (OSError, ValueError):
+            continue
+        index_conversation(conv)
+        done += 1
+    _caught_up = True
+    return done
+
+
+def _match_expression(query: str) -> str:
+    # every word must match; the last one as a prefix (search as you type). Quoting keeps
+    # FTS5 operators in user input from being interpreted.
+    words = _WORD.findall(fold(query))
+    return " ".join(f'"{w}"' for w in words[:-1]) + (f' "{words[-1]}"*' if words else "")
+
+
+def _snippet(content: str, query: str, width: int = 80) -> str:
+    folded = fold(content)
+    words = _WORD.findall(fold(query))
+    pos = min((p for p in (folded.find(w) for w in words) if p >= 0), default=0)
+    start = max(0, pos - width // 3)
+    if start:
+        start = content.rfind(" ", 0, start) + 1  # do not cut a word in half
+    text = " ".join(content[start:start + width].split())
+    return ("…" if start > 0 else "") + text + ("…" if start + width < len(content) else "")
+
+
+def is_caught_up() -> bool:
+    """True once a catch-up has completed in this process (the index covers every conversation)."""
+    return _caught_up
+
+
+def search(query: str, limit: int = 50, wait: bool = True) -> list:
+    """
+    Best matches first: [{"conv_id", "name", "seq", "role", "at", "snippet"}].
+    seq is the message index, or -1 when the conversation name matched.
+
+    The first search catches up the index, or waits for a catch-up already running in
+    another thread. With wait=False it only searches what is indexed so far (for UI
+    threads, which must not block on it; see is_caught_up).
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    if not _caught_up and wait:
+        with _catch_up_lock:
+            if not _caught_up:  # the run we waited for may have done it
+                _catch_up()
+    rows = _connect().execute(
+        "SELECT docs.conv_id, indexed.name, seq, role, at, content FROM docs "
+        "JOIN indexed ON indexed.conv_id = docs.conv_id "
+        "WHERE docs MATCH ? ORDER BY rank LIMIT ?",
+        (f"folded : ({expression})", limit),
+    )
+    return [
+        {"conv_id": r[0], "name": r[1], "seq": r[2], "role": r[3], "at": r[4], "snippet": _snippet(r[5], query)}
+        for r in rows
+    ]
+
+
+def rebuild() -> int:
+    db = _connect()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("DELETE FROM docs")
+        db.execute("DELETE FROM indexed")
+    return catch_up()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.search", description="Search conversations")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="drop and rebuild the index")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        start = time.time()
+        n = rebuild()
+        print(f"✅ indexed {n} conversation(s) in {time.time() - start:.1f}s")
+    if not args.query:
+        return 0
+    start = time.perf_counter()
+    results = search(args.query, args.limit)
+    for r in results:
+        where = "name" if r["seq"] == NAME_SEQ else f"#{r['seq']} {r['role']}"
+        print(f"{r['name']} [{where}] {r['snippet']}")
+    print(f"\n{len(results)} result(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
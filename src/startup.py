@@ -0,0 +1,92 @@
+# src/startup.py
+"""
+Startup import-time report.
+
+    python -m src.startup [module] [--top N] [--target-ms MS]
+    python -m src.app --startup-report [...]
+
+Imports `module` (default src.gui) in a fresh interpreter with `-X importtime`, prints
+the slowest imports by cumulative time and checks the total against STARTUP_TARGET_MS.
+Exits with status 1 when the target is exceeded, so it can be used as a check.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+STARTUP_TARGET_MS = float(os.getenv("STARTUP_TARGET_MS", "1000"))
+# SDKs that must not be imported on the startup path
+HEAVY_MODULES = ("litellm", "openai", "InquirerPy")
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Parse `-X importtime` output into [{"module", "self_us", "cumulative_us", "depth"}],
+    in the order the interpreter reported them.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        rows.append(
+            {
+                "module": stripped,
+                "self_us": int(parts[0]),
+                "cumulative_us": int(parts[1]),
+                "depth": (len(name) - len(stripped) - 1) // 2,
+            }
+        )
+    return rows
+
+
+def measure(module: str = "src.gui") -> dict:
+    """Import `module` in a subprocess and return the parsed import times."""
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+    rows = parse_importtime(proc.stderr)
+    target = next((r for r in reversed(rows) if r["module"] == module), None)
+    total_us = target["cumulative_us"] if target else sum(r["self_us"] for r in rows)
+    loaded = {r["module"] for r in rows}
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "rows": rows,
+        "heavy": sorted(m for m in loaded if m.split(".")[0] in HEAVY_MODULES and "." not in m),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.startup", description="Startup import-time report")
+    parser.add_argument("module", nargs="?", default="src.gui")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS)
+    args = parser.parse_args(argv)
+
+    report = measure(args.module)
+    print(f"{'cumulative ms':>14}  {'self ms':>8}  module")
+    for r in sorted(report["rows"], key=lambda r: r["cumulative_us"], reverse=True)[: args.top]:
+        print(f"{r['cumulative_us'] / 1000:14.1f}  {r['self_us'] / 1000:8.1f}  {'  ' * r['depth']}{r['module']}")
+    print()
+    print(f"import {report['module']}: {report['total_ms']:.0f} ms (target {args.target_ms:.0f} ms)")
+    if report["heavy"]:
+        print(f"heavy SDKs on the startup path: {', '.join(report['heavy'])}")
+    ok = report["total_ms"] <= args.target_ms
+    print("OK" if ok else "OVER TARGET")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
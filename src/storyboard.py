@@ -0,0 +1,365 @@
+# src/storyboard.py
+"""
+Storyboard pipeline: render every scene of a script like prompt_template/prompt.md.
+
+    python -m src.storyboard prompt_template/prompt.md --out storyboard_output/prompt
+    python -m src.storyboard prompt_template/prompt.md --dry-run
+
+Each "#### **PHÂN CẢNH <n> (<time>): <title>**" block gives the MC narration (rendered
+with TTS) and a ```json video prompt (rendered with Veo). All narrations and videos are
+submitted concurrently (STORYBOARD_MAX_VIDEOS caps the Veo jobs). A scene whose JSON has
+"first_frame": "previous" (or "scene 3", or an image path) starts from that scene's last
+frame, so it waits for it; extracting the frame needs ffmpeg on PATH.
+
+Per-scene status is kept in <out>/storyboard.json with a hash of each task's inputs, so
+a re-run only regenerates scenes that failed, changed, or whose upstream scene changed.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+
+from . import api
+from .cache import cache_key
+from .logger import log_json
+
+STORYBOARD_MAX_VIDEOS = int(os.getenv("STORYBOARD_MAX_VIDEOS", "4"))
+
+_SCENE_RE = re.compile(r"^#+\s*\**\s*PHÂN CẢNH\s+(\d+)\s*(?:\(([^)]*)\))?\s*:?\s*(.*?)\**\s*$", re.MULTILINE)
+_NARRATION_RE = re.compile(r"Lời dẫn của MC:\**\s*[\"“](.*?)[\"”]", re.DOTALL)
+_JSON_RE = re.compile(r"```json\s*(\{.*?\})\s*```", re.DOTALL)
+_PREVIOUS = ("previous", "prev", "cảnh trước")
+
+# Keys of the scene JSON that map to API parameters rather than prompt text
+_PARAM_KEYS = ("negative_prompt", "duration", "aspect_ratio", "model", "first_frame", "last_frame", "voice")
+
+
+def parse_storyboard(text: str) -> list:
+    """
+    Parse scene blocks into [{"index", "time", "title", "narration", "video"}], in order.
+    "video" is the scene's JSON prompt (None when the block has none).
+    """
+    matches = list(_SCENE_RE.finditer(text))
+    scenes = []
+    for i, m in enumerate(matches):
+        block = text[m.end(): matches[i + 1].start() if i + 1 < len(matches) else len(text)]
+        narration = _NARRATION_RE.search(block)
+        video_json = _JSON_RE.search(block)
+        video = None
+        if video_json:
+            try:
+                video = json.loads(video_json.group(1))
+            except ValueError as e:
+                raise ValueError(f"PHÂN CẢNH {m.group(1)}: invalid JSON prompt ({e})")
+        scenes.append(
+            {
+                "index": int(m.group(1)),
+                "time": (m.group(2) or "").strip(),
+                "title": m.group(3).strip(" *"),
+                "narration": " ".join(narration.group(1).split()) if narration else None,
+                "video": video,
+            }
+        )
+    return scenes
+
+
+def first_frame_source(scene: dict, by_index: dict):
+    """
+    ("scene", n) when the scene starts from scene n's last frame, ("file", path) for an
+    image path, or None.
+    """
+    ref = (scene.get("video") or {}).get("first_frame")
+    if not ref:
+        return None
+    ref_l = str(ref).strip().lower()
+    if ref_l in _PREVIOUS:
+        earlier = [i for i in by_index if i < scene["index"]]
+        if not earlier:
+            raise ValueError(f"PHÂN CẢNH {scene['index']}: first_frame 'previous' but there is no earlier scene")
+        return ("scene", max(earlier))
+    m = re.fullmatch(r"(?:scene|cảnh)\s*(\d+)", ref_l)
+    if m:
+        n = int(m.group(1))
+        if n not in by_index or n >= scene["index"]:
+            raise ValueError(f"PHÂN CẢNH {scene['index']}: first_frame must reference an earlier scene, got '{ref}'")
+        return ("scene", n)
+    return ("file", ref)
+
+
+def video_prompt(video: dict) -> str:
+    """The descriptive part of the scene JSON, sent as the Veo prompt (as when pasted by hand)."""
+    descriptive = {k: v for k, v in video.items() if k not in _PARAM_KEYS}
+    if list(descriptive) == ["prompt"]:
+        return descriptive["prompt"]
+    return json.dumps(descriptive, ensure_ascii=False, indent=2)
+
+
+def extract_last_frame(video_path) -> bytes:
+    """Last frame of a video as PNG bytes (uses ffmpeg)."""
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("ffmpeg is required to chain scenes by their last frame but was not found on PATH")
+    proc = subprocess.run(
+        # seek to just before the end and take the first frame found there
+        ["ffmpeg", "-v", "error", "-sseof", "-0.1", "-i", str(video_path), "-frames:v", "1",
+         "-f", "image2pipe", "-vcodec", "png", "-"],
+        capture_output=True,
+        timeout=120,
+    )
+    if proc.returncode != 0 or not proc.stdout:
+        raise RuntimeError(f"could not extract the last frame of {video_path}: {proc.stderr.decode(errors='replace')[-300:]}")
+    return proc.stdout
+
+
+class Storyboard:
+    """Renders the scenes of one script into out_dir, tracking per-task status in storyboard.json."""
+
+    def __init__(self, scenes: list, out_dir, base_dir=".", video_model="veo-3.0-generate-001",
+                 aspect_ratio="16:9", tts_model="gemini-2.5-flash-preview-tts", voice="Zephyr"):
+        self.scenes = scenes
+        self.by_index = {s["index"]: s for s in scenes}
+        self.out_dir = Path(out_dir)
+        self.base_dir = Path(base_dir)
+        self.video_model = video_model
+        self.aspect_ratio = aspect_ratio
+        self.tts_model = tts_model
+        self.voice = voice
+        self.state_path = self.out_dir / "storyboard.json"
+        self.state = self._load_state()
+        self._video_tasks = {}
+        self._video_slots = None
+
+    # ---------- State ----------
+    def _load_state(self) -> dict:
+        try:
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"scenes": {}}
+
+    def _save_state(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    def _entry(self, index: int, task: str) -> dict:
+        return self.state["scenes"].setdefault(str(index), {}).get(task) or {}
+
+    def _set(self, index: int, task: str, entry: dict):
+        self.state["scenes"].setdefault(str(index), {})[task] = entry
+        self._save_state()
+
+    def _up_to_date(self, index: int, task: str, input_hash: str) -> bool:
+        entry = self._entry(index, task)
+        return entry.get("status") == "done" and entry.get("hash") == input_hash and bool(entry.get("path")) and Path(entry["path"]).exists()
+
+    # ---------- Input hashes ----------
+    def tts_hash(self, scene: dict) -> str:
+        voice = (scene.get("video") or {}).get("voice", self.voice)
+        return cache_key("storyboard.tts", scene["narration"], self.tts_model, voice)
+
+    def video_hash(self, scene: dict) -> str:
+        video = scene["video"]
+        source = first_frame_source(scene, self.by_index)
+        upstream = None
+        if source and source[0] == "scene":
+            upstream = self.video_hash(self.by_index[source[1]])  # upstream changes cascade
+        elif source:
+            p = self._path(source[1])
+            upstream = ["file", str(p), p.stat().st_mtime_ns if p.exists() else None]
+        return cache_key("storyboard.video", video, self.video_model, self.aspect_ratio, upstream)
+
+    def _path(self, p) -> Path:
+        p = Path(p)
+        return p if p.is_absolute() else self.base_dir / p
+
+    # ---------- Tasks ----------
+    async def _tts(self, scene: dict):
+        index = scene["index"]
+        input_hash = self.tts_hash(scene)
+        if self._up_to_date(index, "tts", input_hash):
+            return "skipped"
+        try:
+            return await self._render_tts(scene, input_hash)
+        except Exception as e:
+            entry = {"status": "failed", "hash": input_hash, "error": f"{e.__class__.__name__}: {e}"}
+            self._set(index, "tts", entry)
+            self._log(index, "tts", entry)
+            return "failed"
+
+    async def _render_tts(self, scene: dict, input_hash: str):
+        index = scene["index"]
+        start = time.time()
+        self._set(index, "tts", {"status": "running", "hash": input_hash})
+        voice = (scene.get("video") or {}).get("voice", self.voice)
+        # a name of its own per scene: scenes are synthesized concurrently
+        result = await api.atext_to_speech(
+            scene["narration"], model=self.tts_model, voice=voice, filename=f"{self.out_dir.name}_scene_{index:02d}_{voice}"
+        )
+        entry = {"status": "failed", "hash": input_hash, "error": result.get("error")}
+        if result.get("success"):
+            dest = self.out_dir / "audio" / f"scene_{index:02d}{os.path.splitext(result['path'])[1]}"
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(result["path"], dest)
+            entry = {"status": "done", "hash": input_hash, "path": str(dest), "cache": result.get("cache")}
+        entry["elapsed_ms"] = int((time.time() - start) * 1000)
+        self._set(index, "tts", entry)
+        self._log(index, "tts", entry)
+        return entry["status"]
+
+    def _video_task(self, index: int):
+        if index not in self._video_tasks:
+            self._video_tasks[index] = asyncio.ensure_future(self._video(self.by_index[index]))
+        return self._video_tasks[index]
+
+    async def _video(self, scene: dict):
+        index = scene["index"]
+        input_hash = self.video_hash(scene)
+        if self._up_to_date(index, "video", input_hash):
+            return "skipped"
+        try:
+            return await self._render_video(scene, input_hash)
+        except Exception as e:
+            entry = {"status": "failed", "hash": input_hash, "error": f"{e.__class__.__name__}: {e}"}
+            self._set(index, "video", entry)
+            self._log(index, "video", entry)
+            return "failed"
+
+    async def _render_video(self, scene: dict, input_hash: str):
+        index = scene["index"]
+        first_frame = None
+        source = first_frame_source(scene, self.by_index)
+        if source and source[0] == "scene":
+            upstream = await self._video_task(source[1])
+            if upstream == "failed":
+                raise RuntimeError(f"upstream scene {source[1]} failed")
+            upstream_path = self._entry(source[1], "video")["path"]
+            first_frame = await asyncio.to_thread(extract_last_frame, upstream_path)
+            frame_path = self.out_dir / "frames" / f"scene_{source[1]:02d}_last.png"
+            frame_path.parent.mkdir(parents=True, exist_ok=True)
+            frame_path.write_bytes(first_frame)
+        elif source:
+            first_frame = self._path(source[1]).read_bytes()
+        last_frame_ref = scene["video"].get("last_frame")
+        last_frame = self._path(last_frame_ref).read_bytes() if last_frame_ref else None
+
+        async with self._video_slots:
+            start = time.time()
+            self._set(index, "video", {"status": "running", "hash": input_hash})
+            dest = self.out_dir / "videos" / f"scene_{index:02d}.mp4"
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            video = scene["video"]
+            result = await api.agenerate_video(
+                video_prompt(video),
+                model=video.get("model", self.video_model),
+                aspect_ratio=video.get("aspect_ratio", self.aspect_ratio),
+                duration=video.get("duration", 8),
+                negative_prompt=video.get("negative_prompt", "blurry, low quality"),
+                person_generation="allow_adult" if first_frame or last_frame else "allow_all",
+                first_frame_image_data=first_frame,
+                last_frame_image_data=last_frame,
+                meta={"storyboard": str(self.out_dir), "scene": index, "hash": input_hash},
+                output_path=str(dest),
+                resume=True,  # reuse the job of an interrupted run for the same inputs
+            )
+        entry = {"status": "failed", "hash": input_hash, "error": result.get("error")}
+        if result.get("success"):
+            entry = {"status": "done", "hash": input_hash, "path": result["video_path"], "job_id": result.get("job_id")}
+        entry["elapsed_ms"] = int((time.time() - start) * 1000)
+        self._set(index, "video", entry)
+        self._log(index, "video", entry)
+        return entry["status"]
+
+    def _log(self, index: int, task: str, entry: dict):
+        log_json({"type": "storyboard.scene", "outDir": str(self.out_dir), "scene": index, "task": task, **entry,
+                  "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())})
+        print(f"[{entry['status']}] scene {index} {task}" + (f": {entry['error']}" if entry.get("error") else ""), flush=True)
+
+    def plan(self, videos=True, tts=True) -> list:
+        """[(scene index, task, "up to date" | "render", depends on)] without running anything."""
+        rows = []
+        for s in self.scenes:
+            if tts and s["narration"]:
+                rows.append((s["index"], "tts", "up to date" if self._up_to_date(s["index"], "tts", self.tts_hash(s)) else "render", None))
+            if videos and s["video"]:
+                source = first_frame_source(s, self.by_index)
+                dep = source[1] if source and source[0] == "scene" else None
+                rows.append((s["index"], "video", "up to date" if self._up_to_date(s["index"], "video", self.video_hash(s)) else "render", dep))
+        return rows
+
+    async def arun(self, videos=True, tts=True) -> dict:
+        """Render every out-of-date task concurrently; returns counts per status."""
+        self._video_slots = asyncio.Semaphore(max(1, STORYBOARD_MAX_VIDEOS))
+        self._video_tasks = {}
+        coros = []
+        for s in self.scenes:
+            if tts and s["narration"]:
+                coros.append(self._tts(s))
+            if videos and s["video"]:
+                coros.append(self._video_task(s["index"]))
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        counts = {"done": 0, "failed": 0, "skipped": 0}
+        for r in results:
+            if isinstance(r, BaseException):
+                counts["failed"] += 1
+                print(f"[failed] {r.__class__.__name__}: {r}", flush=True)
+            else:
+                counts[r] += 1
+        return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.storyboard", description="Render the scenes of a storyboard script")
+    parser.add_argument("script", nargs="?", default="prompt_template/prompt.md")
+    parser.add_argument("--out", help="output directory (default storyboard_output/<script name>)")
+    parser.add_argument("--video-model", default="veo-3.0-generate-001")
+    parser.add_argument("--aspect-ratio", default="16:9")
+    parser.add_argument("--tts-model", default="gemini-2.5-flash-preview-tts")
+    parser.add_argument("--voice", default="Zephyr")
+    parser.add_argument("--no-video", action="store_true")
+    parser.add_argument("--no-tts", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="show what would be rendered")
+    args = parser.parse_args(argv)
+
+    script = Path(args.script)
+    try:
+        scenes = parse_storyboard(script.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+    if not scenes:
+        print(f"❌ No 'PHÂN CẢNH' blocks found in {script}")
+        return 2
+
+    board = Storyboard(
+        scenes,
+        Path(args.out) if args.out else Path("storyboard_output") / script.stem,
+        base_dir=script.parent,
+        video_model=args.video_model,
+        aspect_ratio=args.aspect_ratio,
+        tts_model=args.tts_model,
+        voice=args.voice,
+    )
+    videos, tts = not args.no_video, not args.no_tts
+    try:
+        plan = board.plan(videos, tts)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    for index, task, status, dep in plan:
+        print(f"scene {index:>2} {task:<5} {status}" + (f" (after scene {dep})" if dep else ""))
+    if args.dry_run:
+        return 0
+
+    counts = api._run_sync(board.arun(videos, tts))
+    print(f"\n✅ {counts['done']} rendered, ⏭  {counts['skipped']} up to date, ❌ {counts['failed']} failed — {board.state_path}")
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+# src/video_jobs.py
+"""
+Durable manager for long-running Veo operations.
+
+Every submitted operation is recorded in a job journal (one JSON file per job under
+data/video_jobs/), so an operation_name survives a restart. A single scheduler task
+polls all pending operations with adaptive backoff instead of one sleep-loop per job.
+The manager lives on the shared API event loop (see api._get_loop); use the wrappers
+in src/api.py rather than calling it from other threads.
+
+A job that finishes while nobody waits for it (it was resumed after a restart, or its
+caller timed out) and that belongs to a conversation (meta["conversationId"]) is
+delivered by the manager itself: the video is downloaded to meta["output_path"], stored
+in the blob store and announced in the conversation. Journal entries of finished jobs
+are removed VIDEO_JOB_KEEP_S after they finished.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+from pathlib import Path
+
+from . import api
+from .logger import log_json
+from .paths import VIDEO_JOBS_DIR
+
+POLL_INITIAL_S = float(os.getenv("VIDEO_POLL_INITIAL_S", "5"))
+POLL_MAX_S = float(os.getenv("VIDEO_POLL_MAX_S", "30"))
+POLL_BACKOFF = float(os.getenv("VIDEO_POLL_BACKOFF", "1.5"))
+MAX_CONCURRENT_POLLS = int(os.getenv("VIDEO_MAX_CONCURRENT_POLLS", "16"))
+MAX_POLL_ERRORS = int(os.getenv("VIDEO_MAX_POLL_ERRORS", "5"))
+JOB_MAX_AGE_S = float(os.getenv("VIDEO_JOB_MAX_AGE_S", str(2 * 3600)))
+JOB_KEEP_S = float(os.getenv("VIDEO_JOB_KEEP_S", str(7 * 24 * 3600)))
+# finished videos can be downloaded from the gateway for about two days
+REUSE_DONE_MAX_AGE_S = 24 * 3600
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+FINAL_STATES = {DONE, FAILED, CANCELLED, EXPIRED}
+
+
+class VideoJobManager:
+    def __init__(self, journal_dir=VIDEO_JOBS_DIR):
+        self.journal_dir = Path(journal_dir)
+        self.jobs = {}
+        self._waiters = {}  # job_id -> [asyncio.Future]
+        self._wakeup = None
+        self._task = None
+        self._poll_slots = None
+        self._in_flight = set()  # job ids with a poll request running
+
+    # ---------- Journal ----------
+    def _write(self, job: dict):
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        p = self.journal_dir / f"{job['id']}.json"
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps(job, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def _load(self):
+        if not self.journal_dir.exists():
+            return
+        for p in self.journal_dir.glob("*.json"):
+            try:
+                job = json.loads(p.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            if job.get("status") == PENDING:
+                # poll resumed jobs right away, the backoff restarts from scratch
+                job["next_poll_at"] = 0
+                job["interval_s"] = POLL_INITIAL_S
+            self.jobs[job["id"]] = job
+
+    def _prune(self):
+        """Forget finished jobs older than JOB_KEEP_S."""
+        cutoff = (time.time() - JOB_KEEP_S) * 1000
+        for job in list(self.jobs.values()):
+            if job["status"] in FINAL_STATES and job["updatedAt"] < cutoff:
+                del self.jobs[job["id"]]
+                try:
+                    (self.journal_dir / f"{job['id']}.json").unlink()
+                except FileNotFoundError:
+                    pass
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        """Load the journal and start the scheduler (idempotent; call on the API loop)."""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._poll_slots = asyncio.Semaphore(MAX_CONCURRENT_POLLS)
+        self._load()
+        self._prune()
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run())
+        for job in self.jobs.values():
+            if self._undelivered(job):
+                loop.create_task(self._deliver(job))  # finished, but the last run died before delivering
+
+    async def submit(self, operation_name: str, meta: dict | None = None) -> str:
+        self.start()
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "operation_name": operation_name,
+            "status": PENDING,
+            "createdAt": int(now * 1000),
+            "updatedAt": int(now * 1000),
+            "polls": 0,
+            "poll_errors": 0,
+            "interval_s": POLL_INITIAL_S,
+            "next_poll_at": now + POLL_INITIAL_S,
+            "meta": meta or {},
+            "result": None,
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        self._write(job)
+        self._wakeup.set()
+        return job["id"]
+
+    async def wait(self, job_id: str, timeout: float | None = None) -> dict:
+        """Wait until the job reaches a final state and return a copy of it."""
+        self.start()
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown video job: {job_id}")
+        if job["status"] in FINAL_STATES:
+            return dict(job)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if fut in waiters:
+                waiters.remove(fut)
+
+    def status(self, job_id: str) -> dict | None:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    def list(self, status: str | None = None) -> list:
+        jobs = [dict(j) for j in self.jobs.values() if status is None or j["status"] == status]
+        jobs.sort(key=lambda j: j["createdAt"], reverse=True)
+        return jobs
+
+    def find(self, match: dict, max_done_age_s: float = REUSE_DONE_MAX_AGE_S) -> str | None:
+        """
+        Newest pending job, or job done within max_done_age_s, whose meta contains every
+        item of match; None if there is none.
+        """
+        cutoff = (time.time() - max_done_age_s) * 1000
+        for job in self.list():
+            if job["status"] == PENDING or (job["status"] == DONE and job["updatedAt"] >= cutoff):
+                if all(job["meta"].get(k) == v for k, v in match.items()):
+                    return job["id"]
+        return None
+
+    async def cancel(self, job_id: str) -> dict | None:
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] in FINAL_STATES:
+            return self.status(job_id)
+        try:
+            await api.acancel_video_operation(job["operation_name"])
+        except Exception as e:
+            # Best effort: the gateway may not support :cancel, stop tracking it anyway
+            job["error"] = f"cancel request failed: {e}"
+        self._finish(job, CANCELLED)
+        return self.status(job_id)
+
+    # ---------- Scheduler ----------
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            waiting = [j for j in self.jobs.values() if j["status"] == PENDING and j["id"] not in self._in_flight]
+            for job in waiting:
+                if job["next_poll_at"] <= now:
+                    self._in_flight.add(job["id"])
+                    loop.create_task(self._poll(job))
+
+            upcoming = [j["next_poll_at"] for j in waiting if j["id"] not in self._in_flight]
+            delay = max(0.0, min(upcoming) - time.time()) if upcoming else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job: dict):
+        try:
+            await self._poll_once(job)
+        finally:
+            self._in_flight.discard(job["id"])
+            self._wakeup.set()
+
+    async def _poll_once(self, job: dict):
+        async with self._poll_slots:
+            if job["status"] != PENDING:
+                return
+            if time.time() * 1000 - job["createdAt"] > JOB_MAX_AGE_S * 1000:
+                job["error"] = "Video job expired before completion."
+                self._finish(job, EXPIRED)
+                return
+
+            job["polls"] += 1
+            try:
+                result = await api.apoll_video_operation(job["operation_name"])
+            except Exception as e:
+                job["poll_errors"] += 1
+                job["error"] = str(e)
+                if job["poll_errors"] >= MAX_POLL_ERRORS:
+                    self._finish(job, FAILED)
+                else:
+                    self._backoff(job)
+                return
+
+            if job["status"] != PENDING:
+                return  # cancelled while the poll was in flight
+            job["poll_errors"] = 0
+            if result.get("done"):
+                try:
+                    job["result"] = api.parse_video_operation(result)
+                    job["error"] = None
+                    self._finish(job, DONE)
+                except ValueError as e:
+                    job["error"] = str(e)
+                    self._finish(job, FAILED)
+            else:
+                self._backoff(job)
+
+    def _backoff(self, job: dict):
+        job["interval_s"] = min(job["interval_s"] * POLL_BACKOFF, POLL_MAX_S)
+        job["next_poll_at"] = time.time() + job["interval_s"]
+        job["updatedAt"] = int(time.time() * 1000)
+        self._write(job)
+
+    def _finish(self, job: dict, status: str):
+        job["status"] = status
+        job["updatedAt"] = int(time.time() * 1000)
+        waiters = [fut for fut in self._waiters.pop(job["id"], []) if not fut.done()]
+        if status == DONE and not waiters and job["meta"].get("conversationId"):
+            job["delivered"] = False
+        self._write(job)
+        for fut in waiters:
+            fut.set_result(dict(job))
+        log_json(
+            {
+                "type": "video.job",
+                "jobId": job["id"],
+                "operation_name": job["operation_name"],
+                "status": status,
+                "polls": job["polls"],
+                "result": job["result"],
+                "error": job["error"],
+                "elapsed_ms": job["updatedAt"] - job["createdAt"],
+                "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+        )
+        if self._undelivered(job):
+            asyncio.get_running_loop().create_task(self._deliver(job))
+        self._prune()
+
+    # ---------- Delivery of unattended jobs ----------
+    @staticmethod
+    def _undelivered(job: dict) -> bool:
+        return job["status"] == DONE and job.get("delivered") is False
+
+    async def _deliver(self, job: dict):
+        """Download the video of a finished job and add it to its conversation."""
+        from . import blobs
+        from .conversations import load_conversation, append_message
+
+        meta = job["meta"]
+        path = meta.get("output_path") or os.path.join("generated_videos", f"generated_video_{job['updatedAt'] // 1000}.mp4")
+        try:
+            await api.adownload_video_to_file(job["result"]["video_id"], path)
+            await asyncio.to_thread(blobs.adopt_output, path)
+            conv = await asyncio.to_thread(load_conversation, meta["conversationId"])
+            prompt = meta.get("prompt") or ""
+            await asyncio.to_thread(
+                append_message,
+                conv,
+                "assistant",
+                f"Generated video using {meta.get('model')} (finished in the background)\n"
+                f"- Prompt: {prompt[:180]}{'...' if len(prompt) > 180 else ''}\n"
+                f"- Saved to: {path}",
+            )
+        except Exception as e:
+            job["error"] = f"delivery failed: {e}"
+            self._write(job)
+            log_json({"type": "video.job.delivery_error", "jobId": job["id"], "error": job["error"]})
+            return
+        job["delivered"] = True
+        job["result"] = {**job["result"], "path": path}
+        self._write(job)
+        log_json(
+            {
+                "type": "video.job.delivered",
+                "jobId": job["id"],
+                "conversationId": meta["conversationId"],
+                "path": path,
+                "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+        )
+
+
+_manager = None
+
+
+def get_manager() -> VideoJobManager:
+    """Process-wide manager; started lazily on the calling (API) loop."""
+    global _manager
+    if _manager is None:
+        _manager = VideoJobManager()
+    _manager.start()
+    return _manager